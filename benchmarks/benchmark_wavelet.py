@@ -0,0 +1,70 @@
+"""
+Timing and agreement checks for the TheoreticalWavelet time domain paths.
+
+Run with `python benchmarks/benchmark_wavelet.py`.
+"""
+import timeit
+
+import numpy as np
+
+from dcrhino3.signal_processing.filters import FIRLSFilter
+
+from theory.core import Pipe, Rock, TheoreticalWavelet
+
+VELOCITIES = [800, 2000, 3500]
+DENSITY = 2500
+REPEAT = 20
+
+
+def make_wavelet(velocity, component='axial'):
+    pipe = Pipe(Rb=0.14, alpha=5100, rho=7300, beta=2668)
+    rock = Rock(alpha=velocity, beta=velocity, rho=DENSITY, component=component)
+    return TheoreticalWavelet(pipe, rock, component=component)
+
+
+def legacy_primary_in_time_domain(wavelet):
+    """
+    The mirrored spectrum + complex ifft path (amplitude/phase round trip).
+    """
+    return wavelet._wavelet_to_timedomain(*wavelet.primary_in_frequency_domain).real
+
+
+def benchmark_irfft():
+    print('primary_in_time_domain: mirrored complex ifft vs irfft')
+    for velocity in VELOCITIES:
+        wavelet = make_wavelet(velocity)
+        spectrum = wavelet.primary_in_frequency_domain_complex
+        legacy = legacy_primary_in_time_domain(wavelet)
+        current = wavelet.primary_in_time_domain()
+        # The time series are cached on the wavelet, time the transforms.
+        legacy_time = timeit.timeit(
+            lambda: legacy_primary_in_time_domain(wavelet), number=REPEAT) / REPEAT
+        current_time = timeit.timeit(
+            lambda: wavelet._spectrum_to_timedomain(spectrum), number=REPEAT) / REPEAT
+        print('  alpha {:>5}: legacy {:.2f} ms | irfft {:.2f} ms | max rel diff {:.2e}'.format(
+            velocity, legacy_time * 1e3, current_time * 1e3, np.abs(legacy - current).max() / np.abs(legacy).max()))
+
+
+def benchmark_fir_taps(number=200):
+    print('TheoreticalWavelet construction with filter taps')
+    pipe = Pipe(Rb=0.14, alpha=5100, rho=7300, beta=2668)
+    filterby = [10, 20, 100, 120]
+
+    def redesigned():
+        # What every constructor used to do.
+        wavelet = TheoreticalWavelet(pipe, Rock(alpha=2000, rho=DENSITY), filterby=filterby)
+        return FIRLSFilter(filterby, wavelet.filter_duration).make(wavelet.sampling_rate)
+
+    def shared():
+        wavelet = TheoreticalWavelet(pipe, Rock(alpha=2000, rho=DENSITY), filterby=filterby)
+        return wavelet.fir_taps
+
+    redesigned_time = timeit.timeit(redesigned, number=number) / number
+    shared_time = timeit.timeit(shared, number=number) / number
+    print('  per wavelet: redesigned taps {:.1f} us | shared taps {:.1f} us | same taps: {}'.format(
+        redesigned_time * 1e6, shared_time * 1e6, np.array_equal(redesigned(), shared())))
+
+
+if __name__ == '__main__':
+    benchmark_irfft()
+    benchmark_fir_taps()
@@ -7,5 +7,11 @@ setup(
     author_email="bruno@datacloud.com",
     packages=["theory"],
     include_package_data=True,
-    install_requires=["numpy", "scipy", "dash", "plotly", "flask", "tqdm"],
+    install_requires=["numpy", "scipy", "pandas", "dash", "plotly", "flask", "tqdm"],
+    extras_require={
+        "numexpr": ["numexpr"],
+        "sympy": ["sympy"],
+        "pyarrow": ["pyarrow"],
+        "all": ["numexpr", "sympy", "pyarrow"],
+    },
 )
@@ -0,0 +1,77 @@
+from itertools import product
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from theory.feature_extraction import RhinoPhysics
+
+
+def features(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for component, window, feature in product(
+        ["axial", "tangential"],
+        ["primary", "multiple_1", "multiple_2"],
+        [
+            "time_pick",
+            "amplitude",
+            "integrated_absolute_amplitude",
+            "jazz1_left_integrated_amplitude",
+            "jazz1_right_integrated_amplitude",
+        ],
+    ):
+        columns["J2-{}-{}-{}".format(component, window, feature)] = rng.uniform(0.5, 2, rows)
+    return pd.DataFrame(columns)
+
+
+@pytest.fixture
+def dataframe():
+    return features(110)
+
+
+@pytest.mark.parametrize("backend", RhinoPhysics.BACKENDS)
+def test_append_after_compute(dataframe, backend):
+    physics = RhinoPhysics(dataframe[:100].copy(), backend=backend)
+    physics.compute(["a_ratio", "c_modulus_p"])
+    physics.append(dataframe[100:].copy())
+
+    expected = RhinoPhysics(dataframe, backend=backend).compute(["a_ratio", "c_modulus_p"])
+    computed = physics.compute(["a_ratio", "c_modulus_p"])
+    for name, value in expected.items():
+        np.testing.assert_array_equal(computed[name], value)
+
+
+@pytest.mark.parametrize("backend", RhinoPhysics.BACKENDS)
+def test_append_after_populate(dataframe, backend):
+    physics = RhinoPhysics(dataframe[:100].copy(), backend=backend)
+    physics._populate()
+    physics.append(dataframe[100:].copy())
+    physics._populate()
+
+    expected = RhinoPhysics(dataframe.copy(), backend=backend)
+    expected._populate()
+    assert len(physics.dataframe) == 110
+    assert not physics.dataframe["a_ratio"].isna().any()
+    pd.testing.assert_frame_equal(
+        physics.dataframe.reset_index(drop=True), expected.dataframe
+    )
+
+
+@pytest.mark.parametrize("backend", RhinoPhysics.BACKENDS)
+def test_append_then_compute(dataframe, backend):
+    physics = RhinoPhysics(dataframe[:100].copy(), backend=backend)
+    physics.append(dataframe[100:].copy())
+
+    computed = physics.compute(["a_ratio"])
+    expected = RhinoPhysics(dataframe, backend=backend).compute(["a_ratio"])
+    np.testing.assert_array_equal(computed["a_ratio"], expected["a_ratio"])
+
+
+@pytest.mark.parametrize("backend", RhinoPhysics.BACKENDS)
+def test_setitem_after_compute(dataframe, backend):
+    physics = RhinoPhysics(dataframe.copy(), backend=backend)
+    physics.compute(["a_ratio"])
+    physics["J2-axial-primary-amplitude"] = np.zeros(len(dataframe))
+
+    np.testing.assert_array_equal(physics.compute(["a_ratio"])["a_ratio"], 0)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from theory.fitting import GROUP_STATISTICS, fit_groups, fit_models
+from theory.function_handler import ModelingFunction
+
+# The candidates of the Modeling notebooks and their number of parameters.
+NOTEBOOK_EQUATIONS = {
+    "line_function": ("a * x + b", 2),
+    "power_func": ("a * (x + b)**(c)", 3),
+    "power_func2": (
+        "(((a * (((x)+b)**c) + d) + (e*x) + f) / (g  * ((x) ** (2)) + h * x + i) * j)",
+        10,
+    ),
+    "power_func3": ("((a * (((x)+b)**c) + d) / (e  * ((x) ** (2)) + f * x + g) * h)", 8),
+    "power_func4": ("((a * (((x)+b)**c) + d)  / (e * (x) + f) * g)", 7),
+    "exponential_func": ("a * np.exp(-b * np.asarray(x)) + c", 3),
+    "quadratic_func": ("(a * x**2) + (b * x) + c", 3),
+    "cubic_func": ("(a * x**3) + (b * x**2) + (c * x) + d", 4),
+    "quartic_func": ("(a * x**4) + (b * x**3) + (c * x**2) + (d * x) + e", 5),
+}
+
+
+def test_exponential_names():
+    model = ModelingFunction(NOTEBOOK_EQUATIONS["exponential_func"][0])
+    assert model.variables == ["x"]
+    assert model.constants == ["a", "b", "c"]
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_fit_models_parameters():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(1, 6, 200)
+    y = 80 * (x + 0.3) ** -1.4 + 5 + rng.normal(0, 0.5, len(x))
+    table = fit_models(
+        dict((name, equation) for name, (equation, _) in NOTEBOOK_EQUATIONS.items()),
+        x, y, starts=1, processes=1,
+    )
+    for name, (_, parameters) in NOTEBOOK_EQUATIONS.items():
+        assert table.loc[name, "parameters"] == parameters, name
+
+
+def test_fit_groups_columns():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 3, 400)
+    dataframe = pd.DataFrame(dict(
+        group=np.repeat([0, 1], 200),
+        x=x,
+        y=5 * np.exp(-0.7 * x) + 1 + rng.normal(0, 0.05, len(x)),
+    ))
+    table = fit_groups(dataframe, NOTEBOOK_EQUATIONS["exponential_func"][0], "x", "y", "group",
+                       processes=1)
+    assert list(table.columns) == ["a", "b", "c"] + GROUP_STATISTICS
+    np.testing.assert_allclose(table["b"], 0.7, atol=0.05)
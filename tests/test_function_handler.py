@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+import pytest
+
+from theory.function_handler import ModelingFunction, equation_names, load_models
+
+
+def record(**changes):
+    d = dict(name="line", key="line", equation="a * x + b", variables=["x"],
+             constants=["a", "b"], optimals=[2.0, 1.0])
+    d.update(changes)
+    return d
+
+
+def test_names_in_order_of_appearance():
+    assert equation_names("a * np.exp(-b * np.asarray(x)) + c") == ["a", "b", "x", "c"]
+
+
+def test_load_round_trip(tmp_path):
+    filename = str(tmp_path / "models.json")
+    with open(filename, "w") as f:
+        json.dump(dict(models=[record()]), f)
+    model = load_models(filename)["line"]
+    np.testing.assert_allclose(model.predict(np.array([1.0, 2.0])), [3.0, 5.0])
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        dict(variables=["x=__import__('os').system('echo PWNED-on-load')"]),
+        dict(constants=["a", "b=print('PWNED')"]),
+        dict(equation="__import__('os').system('echo PWNED-on-predict')"),
+        dict(equation="a * x.__class__.__mro__ + b"),
+        dict(equation="np.os.system('echo PWNED') + a * x + b"),
+        dict(equation="(lambda: a)() * x + b"),
+    ],
+)
+def test_load_rejects_hostile_records(tmp_path, capfd, changes):
+    filename = str(tmp_path / "models.json")
+    with open(filename, "w") as f:
+        json.dump(dict(models=[record(**changes)]), f)
+    with pytest.raises(ValueError):
+        load_models(filename)
+    assert "PWNED" not in capfd.readouterr().out
+
+
+def test_save_pickle_filename_warns(tmp_path):
+    model = ModelingFunction("a * x + b")
+    with pytest.warns(FutureWarning):
+        model.save(str(tmp_path / "model.pkl"))
+    assert (tmp_path / "model.json").exists()
+    assert ModelingFunction.load(str(tmp_path / "model.pkl")).equation == "a * x + b"
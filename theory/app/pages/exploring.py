@@ -10,14 +10,13 @@ import matplotlib.pyplot as plt
 
 import numpy as np
 
-from theory.core import Pipe, Rock, TheoreticalWavelet
+from theory.cache import wavelet_cache
+from theory.core import Pipe, Rock, BatchedTheoreticalWavelet
 from theory.app.app import app
 from theory.app.pages.controls import component_controls, pipe_controls, filter_controls, rock_range_controls, wavelet_controls, explore_controls, pegleg, diff_controls
 from theory.plotting import wiggle_plot
 from theory.app.utils import mplfig_to_uri
 
-from scipy import signal
-
 plt.style.use('seaborn-dark')
 
 layout = html.Div(
@@ -64,6 +63,26 @@ def update_alpha_range_title(value, component):
 def update_gain_title(value):
     return "gain: {}".format(str(value))
 
+def full_wavelets(theoretical, wavelet, add_pegleg, delay, rc):
+    '''
+    Full length filtered wavelets of the page, kept in the wavelet_cache
+    under the pipe, rock range, filter and pegleg settings so that moving
+    the window or gain sliders only re-slices them.
+    '''
+    def compute():
+        if add_pegleg:
+            wavelets = getattr(theoretical, '{}_in_time_domain'.format(wavelet))(
+                window=None, filtered=False)
+            wavelets = wavelets + theoretical.pegleg_rocksteel(delay_in_ms=delay, RC=rc, window=None)
+            return theoretical.apply_filter(wavelets)
+        return getattr(theoretical, '{}_in_time_domain'.format(wavelet))(
+            window=None, filtered=True)
+
+    key = wavelet_cache.make_key(
+        'exploring', wavelet, theoretical.pipe.parameters, theoretical.rock.parameters,
+        theoretical.parameters, add_pegleg and (delay, rc))
+    return wavelet_cache.get_or_compute(key, compute)
+
 @app.callback(
     Output("exploring-wavelets", 'src'),
     [
@@ -113,26 +132,18 @@ def update_figure(wavelet, component, pipe_alpha, pipe_rho, pipe_beta, pipe_rb,
     pipe = Pipe(Rb=pipe_rb, alpha=pipe_alpha, rho=pipe_rho, beta=pipe_beta,
                 component=component)
 
-    wavelets = []
-    for a in alpha_range:
-        rock = Rock(alpha=a, beta=a, rho=rho_values[-1], component=component)
-        theoretical = TheoreticalWavelet(pipe, rock, component=component,
-                                         filterby=[bpf1, bpf2, bpf3, bpf4])
-
-        if add_pegleg:
-            w = getattr(theoretical, '{}_in_time_domain'.format(wavelet))(
-                window=None, filtered=False)
-            w += theoretical.pegleg_effect(delay_in_ms=delay, RC=rc, window=None)
-            w = signal.filtfilt(theoretical.fir_taps, 1, w)
-            w = theoretical.get_window_from_center(window, w)
-        else:
-            w = getattr(theoretical, '{}_in_time_domain'.format(wavelet))(
-                window, filtered=True)
+    rock = Rock(alpha=alpha_range, beta=alpha_range,
+                rho=np.full(len(alpha_range), rho_values[-1], dtype=float),
+                component=component)
+    theoretical = BatchedTheoreticalWavelet(pipe, rock, component=component,
+                                            filterby=[bpf1, bpf2, bpf3, bpf4],
+                                            filter_domain='frequency')
 
-        if differentiated:
-            w = np.gradient(w, theoretical.sampling_interval)
+    wavelets = theoretical.get_window_from_center(
+        window, full_wavelets(theoretical, wavelet, add_pegleg, delay, rc))
 
-        wavelets.append(w)
+    if differentiated:
+        wavelets = theoretical.apply_derivative(wavelets)
 
     fig, ax = wiggle_plot(wavelets, alpha_range,
                           theoretical.get_time_range_for_window(window), gain=gain)
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .utils import freeze
+
+logger = logging.getLogger(__name__)
+
+
+class WaveletCache(object):
+    """
+    Process-wide LRU cache for computed wavelet spectra and time series.
+
+    Entries are addressed by a hash of their content parameters (pipe, rock,
+    wavelet arguments and FIR corners), so independent TheoreticalWavelet
+    instances built with the same arguments share results. When a directory
+    is given, entries are also written there as .npy files and read back as
+    memory maps, so repeated notebook runs reuse earlier results.
+
+    Args:
+        max_bytes (int): Memory budget of the in-memory tier. 0 disables it.
+        directory (str): Optional folder for the on-disk tier.
+        enabled (bool): When False, get_or_compute always computes.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2, directory=None, enabled=True):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.enabled = enabled
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def make_key(cls, *parts):
+        """
+        Content hash of the given parameters.
+        """
+        return hashlib.sha1(repr(freeze(parts)).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{}.npy'.format(key))
+
+    def _store(self, key, value):
+        size = value.nbytes
+        if size > self.max_bytes:
+            return
+        self._entries[key] = value
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def _read(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            return np.load(path, mmap_mode='r')
+        except (IOError, ValueError) as e:
+            logger.debug("Failed to read {} from wavelet cache, ERROR: {}".format(path, e))
+            return None
+
+    def _write(self, key, value):
+        if not self.directory:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = self._path(key)
+        temporary = '{}.{}.tmp.npy'.format(path[:-4], os.getpid())
+        np.save(temporary, value)
+        os.replace(temporary, path)
+
+    def get(self, key):
+        """
+        Cached array for key (memory first, then disk), or None.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            value = self._read(key)
+            if value is not None:
+                self.disk_hits += 1
+                self._store(key, value)
+                return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        value = np.asarray(value)
+        value.setflags(write=False)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key).nbytes
+            self._store(key, value)
+            self._write(key, value)
+        return value
+
+    def get_or_compute(self, key, compute):
+        if not self.enabled:
+            return compute()
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self, disk=False):
+        """
+        Drop the in-memory entries (and the .npy files when disk is True).
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            if disk and self.directory and os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    if name.endswith('.npy'):
+                        os.remove(os.path.join(self.directory, name))
+
+    @property
+    def stats(self):
+        return dict(entries=len(self._entries),
+                    nbytes=self.nbytes,
+                    max_bytes=self.max_bytes,
+                    hits=self.hits,
+                    disk_hits=self.disk_hits,
+                    misses=self.misses)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "< WaveletCache | Entries: {} | {:.1f}/{:.1f} MB | Hits: {} | Disk hits: {} | Misses: {} >".format(
+            len(self._entries), self.nbytes / 1024 ** 2, self.max_bytes / 1024 ** 2,
+            self.hits, self.disk_hits, self.misses)
+
+
+wavelet_cache = WaveletCache()
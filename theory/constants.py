@@ -123,6 +123,26 @@ MULTIPLE_TO_NOISE_WINDOW_MAP = {"primary": "noise_1", "multiple_1": "noise_1"}
 
 TEMPLATE = "{recipe}-{component}-{window}-{feature}"
 
+SEPARATOR = "-"
+
+# Features looked up in order when a window has no column for the feature itself.
+FEATURE_FALLBACKS = {
+    "time_pick": [
+        "maximum_time",
+        "max_time",
+        "zero_crossing_time",
+        "zero_crossing_positive_slope",
+        "zero_crossing_negative_slope",
+        "minimum_time",
+        "min_time",
+    ],
+    "amplitude": [
+        "integrated_absolute_amplitude",
+        "maximum_amplitude",
+        "max_amplitude",
+    ],
+}
+
 def get_feature_string(
     recipe="K0", component="axial", window="multiple_1", feature="maximum_amplitude"
 ):
@@ -1,12 +1,84 @@
+import copy
+from functools import lru_cache
 import numpy as np
 from scipy import signal
+from scipy.fftpack import next_fast_len
 import pdb
 
 from dcrhino3.signal_processing.filters import FIRLSFilter
 
+from .cache import wavelet_cache
+from .utils import freeze
+
 import warnings
 warnings.filterwarnings("ignore", category=RuntimeWarning)
 
+
+@lru_cache(maxsize=128)
+def _design_fir_taps(corners, filter_duration, sampling_rate):
+    taps = FIRLSFilter(list(corners), filter_duration).make(sampling_rate)
+    taps.setflags(write=False)
+    return taps
+
+
+def design_fir_taps(corners, filter_duration, sampling_rate):
+    '''
+    FIRLS band-pass taps, designed once per (corners, duration, sampling
+    rate) and shared by every wavelet (read only).
+    '''
+    return _design_fir_taps(
+        tuple(float(c) for c in corners), float(filter_duration), float(sampling_rate))
+
+
+@lru_cache(maxsize=128)
+def _design_filter_response(corners, filter_duration, sampling_rate, number_of_samples):
+    taps = _design_fir_taps(corners, filter_duration, sampling_rate)
+    response = np.abs(np.fft.rfft(taps, n=number_of_samples)) ** 2
+    response.setflags(write=False)
+    return response
+
+
+def design_filter_response(corners, filter_duration, sampling_rate, number_of_samples):
+    '''
+    Zero-phase (filtfilt) response |H(f)|^2 of the FIRLS taps on the rfft
+    bins of a number_of_samples long series (read only).
+    '''
+    return _design_filter_response(
+        tuple(float(c) for c in corners), float(filter_duration), float(sampling_rate),
+        int(number_of_samples))
+
+def shift_in_frequency_domain(array, delay_in_ms, sampling_interval):
+    '''
+    Delay a wavelet, or each row of a (wavelet x time) stack by its own
+    delay, with a phase shift in frequency domain. Delays may be fractional
+    samples or negative; the series is zero padded so nothing wraps around.
+
+    Args:
+        array (np.array): Time series along the last axis.
+        delay_in_ms (np.array or float): Delay(s) broadcast against the rows.
+        sampling_interval (float): Sampling interval in seconds.
+    '''
+    array = np.asarray(array, dtype=float)
+    delay = np.broadcast_to(
+        np.asarray(delay_in_ms, dtype=float) / 1000, array.shape[:-1])
+    number_of_samples = array.shape[-1]
+    padding = int(np.ceil(np.max(np.abs(delay), initial=0) / sampling_interval)) + 1
+    fft_length = next_fast_len(number_of_samples + padding)
+
+    spectrum = np.fft.rfft(array, n=fft_length, axis=-1)
+    frequencies = np.fft.rfftfreq(fft_length, sampling_interval)
+    spectrum *= np.exp(-2j * np.pi * frequencies * delay[..., np.newaxis])
+    return np.fft.irfft(spectrum, n=fft_length, axis=-1)[..., :number_of_samples]
+
+
+def multipass_delays(delay_in_ms, num_pipes, pipe_delay_in_ms):
+    '''
+    Delay of a multiple travelling through num_pipes pipes, where
+    delay_in_ms is the delay with a single pipe (num_pipes may be an array).
+    '''
+    return delay_in_ms + (np.asarray(num_pipes) - 1) * pipe_delay_in_ms
+
+
 class Pipe(object):
     """
     Args:
@@ -28,6 +100,7 @@ class Pipe(object):
                  beta=2368,
                  component='axial'):
 
+        self.length = length
         self.outer_diameter = outer_diameter
         self.inner_diameter = inner_diameter
         self.outer_radius = outer_diameter / 2
@@ -41,6 +114,21 @@ class Pipe(object):
         self.contact_factor = contact_factor
         self.component = component
 
+    @property
+    def parameters(self):
+        """
+        Arguments describing this pipe.
+        """
+        return dict(length=self.length,
+                    contact_factor=self.contact_factor,
+                    outer_diameter=self.outer_diameter,
+                    inner_diameter=self.inner_diameter,
+                    Rb=self.Rb,
+                    alpha=self.alpha,
+                    rho=self.rho,
+                    beta=self.beta,
+                    component=self.component)
+
     @property
     def A1(self):
         """
@@ -81,6 +169,12 @@ class Rock(object):
         if component == 'tangential':
             self.modulus = ((rho/1000)*((beta/1000)**2))
 
+    @property
+    def parameters(self):
+        """
+        Arguments describing this rock.
+        """
+        return dict(alpha=self.alpha, rho=self.rho, beta=self.beta)
 
 
 class TheoreticalWavelet(object):
@@ -92,12 +186,18 @@ class TheoreticalWavelet(object):
                  nyquist=5000,
                  filterby=[30, 45, 160, 200],
                  filter_duration=0.02,
-                 component='axial'):
+                 component='axial',
+                 filter_domain='time'):
 
+        if filter_domain not in ('time', 'frequency'):
+            raise ValueError('filter_domain must be "time" or "frequency"')
 
         self.rock = rock
         self.pipe = pipe
         self.component = component
+        self.filterby = filterby
+        self.filter_duration = filter_duration
+        self.filter_domain = filter_domain
 
         self.pipe.component = component
         self.rock.component = component
@@ -113,18 +213,185 @@ class TheoreticalWavelet(object):
         if not (type(self.frequencies) in (int, float)):
             self.symmetric_frequencies = np.r_[-self.frequencies[1:-1][::-1], self.frequencies]
 
-        if self.component == 'axial':
-            self.k = 2 * np.pi * self.frequencies / self.rock.alpha  # wave_number
-        if self.component == 'tangential':
-            self.k = 2 * np.pi * self.frequencies / self.rock.beta  # wave_number
+        self._cache = {}
+        self._cache_state = None
+        # (window, full grid wavelet) of a for_window synthesis.
+        self._synthesis = None
+
+    @property
+    def parameters(self):
+        '''
+        Arguments describing this wavelet, excluding the pipe and the rock.
+        '''
+        return dict(frequency_resolution=self.frequency_resolution,
+                    nyquist=self.nyquist,
+                    filterby=self.filterby,
+                    filter_duration=self.filter_duration,
+                    filter_domain=self.filter_domain,
+                    component=self.component)
+
+    @property
+    def _cache_key(self):
+        return freeze(
+            (self.pipe.parameters, self.rock.parameters, self.parameters))
 
-        self.cot_phi = -1 * (self.k * self.pipe.Rb * (1 + 6 * np.sqrt(3)) / 12)
+    def _content_key(self, name, filtered=False):
+        '''
+        Key of a product in the process-wide wavelet_cache. Unfiltered
+        products do not depend on the filter settings.
+        '''
+        parameters = self.parameters
+        if not filtered:
+            parameters = dict(parameters, filterby=None, filter_duration=None, filter_domain=None)
+        return wavelet_cache.make_key(
+            type(self).__name__, name, self.pipe.parameters, self.rock.parameters, parameters)
+
+    def _cached(self, name, compute, shared=False, filtered=False):
+        '''
+        Memoize compute() under name until the pipe, rock, component or
+        filter settings change. Cached arrays are read only. Shared products
+        are also looked up in the process-wide wavelet_cache.
+        '''
+        key = self._cache_key
+        if key != self._cache_state:
+            self._cache = {}
+            self._cache_state = key
+        if name not in self._cache:
+            if shared:
+                value = wavelet_cache.get_or_compute(
+                    self._content_key(name, filtered), compute)
+            else:
+                value = compute()
+            if isinstance(value, np.ndarray):
+                value.setflags(write=False)
+            self._cache[name] = value
+        return self._cache[name]
+
+    @property
+    def k(self):
+        return self._cached(
+            'k', lambda: 2 * np.pi * self.frequencies / self._rock_velocity)
+
+    @property
+    def cot_phi(self):
+        return self._cached(
+            'cot_phi', lambda: -1 * (self.k * self.pipe.Rb * (1 + 6 * np.sqrt(3)) / 12))
+
+    @property
+    def fir_taps(self):
+        if not self.filterby:
+            return None
+        return design_fir_taps(self.filterby, self.filter_duration, self.sampling_rate)
+
+    def filter_response(self, number_of_samples=None):
+        '''
+        Zero-phase response of the band-pass on the rfft bins of a
+        number_of_samples long series (defaults to the full wavelet length).
+        '''
+        if number_of_samples is None:
+            number_of_samples = 2 * (len(self.frequencies) - 1)
+        return design_filter_response(
+            self.filterby, self.filter_duration, self.sampling_rate, number_of_samples)
+
+    def apply_filter(self, array):
+        '''
+        Zero-phase band-pass of a time series along its last axis.
+
+        filter_domain 'time' runs filtfilt with the FIR taps; 'frequency'
+        multiplies the spectrum by |H(f)|^2, which is equivalent away from
+        the edges of the series and costs one multiply per bin.
+        '''
+        if self.filter_domain == 'frequency':
+            number_of_samples = array.shape[-1]
+            spectrum = np.fft.rfft(array, axis=-1) * self.filter_response(number_of_samples)
+            return np.fft.irfft(spectrum, n=number_of_samples, axis=-1)
+        return signal.filtfilt(self.fir_taps, 1, array)
+
+    def _copy_with(self, rock=None, **parameters):
+        '''
+        Same wavelet with some constructor arguments replaced.
+        '''
+        return type(self)(copy.copy(self.pipe), rock if rock is not None else self.rock,
+                          **dict(self.parameters, **parameters))
+
+    def _probe(self):
+        '''
+        Wavelet used to check the convergence of for_window.
+        '''
+        return self
+
+    @classmethod
+    def _window_error(cls, coarse, fine, window, filtered):
+        '''
+        Largest difference between the windowed outputs of two wavelets,
+        relative to the peak amplitude of the finer one.
+        '''
+        error = 0
+        for name in ('primary', 'reflected'):
+            method = '{}_in_time_domain'.format(name)
+            approximation = getattr(coarse, method)(window, filtered=filtered)
+            reference = getattr(fine, method)(window, filtered=filtered)
+            error = max(error, np.max(
+                np.max(np.abs(approximation - reference), axis=-1)
+                / np.max(np.abs(reference), axis=-1)))
+        return error
+
+    def for_window(self, window, filtered=True, tolerance=1e-3, minimum_samples=1024):
+        '''
+        Windowed synthesis: the same wavelet on the coarsest frequency grid
+        that still reproduces the centered window of the time domain
+        outputs.
+
+        The grid starts at the power of two above 2 x window samples and is
+        refined (doubled) until the windowed primary and reflected wavelets
+        change by less than tolerance / 2 x their peak amplitude, which
+        keeps them within tolerance of the full grid output as long as the
+        error at least halves with each refinement. The check is
+        done on the filtered outputs when filtered is True (and there is a
+        filter), on the unfiltered ones otherwise: read the same kind from
+        the returned wavelet. Slow rocks have longer tails and need finer
+        grids; if no coarse grid converges this wavelet is returned.
+        Filtering on the coarse grid is done in the frequency domain.
+        Time domain outputs without a window or with a wider one are read
+        from this (full grid) wavelet.
+
+        Usage: wavelet.for_window(310).primary_in_time_domain(310, filtered=True)
+        '''
+        filtered = bool(filtered and self.filterby)
+        full_samples = 2 * (len(self.frequencies) - 1)
+        minimum_samples = max(minimum_samples, 2 * window)
+        if self.filterby:
+            minimum_samples = max(minimum_samples, 2 * len(self.fir_taps))
+        number_of_samples = 2 ** int(np.ceil(np.log2(minimum_samples)))
 
-        if filterby:
-            corners = filterby
+        probe = self._probe()
+        coarse = probe._copy_with(
+            frequency_resolution=self.sampling_rate / number_of_samples, filter_domain='frequency')
+        while 2 * number_of_samples < full_samples:
+            finer = probe._copy_with(
+                frequency_resolution=self.sampling_rate / (2 * number_of_samples),
+                filter_domain='frequency')
+            if self._window_error(coarse, finer, window, filtered) <= tolerance / 2:
+                windowed = self._copy_with(
+                    frequency_resolution=self.sampling_rate / number_of_samples,
+                    filter_domain='frequency')
+                windowed._synthesis = (window, self)
+                return windowed
+            coarse = finer
+            number_of_samples *= 2
+        return self
 
-            firls = FIRLSFilter(corners, filter_duration)
-            self.fir_taps = firls.make(self.sampling_rate)
+    def _grid_for(self, window):
+        '''
+        This wavelet, or the full grid one of a for_window synthesis when
+        window is None or wider than the synthesized window.
+        '''
+        if self._synthesis is None:
+            return self
+        synthesis_window, full_grid = self._synthesis
+        if window and window <= synthesis_window:
+            return self
+        return full_grid._grid_for(window)
 
     def get_time_range_for_window(self, window):
         '''
@@ -135,21 +402,29 @@ class TheoreticalWavelet(object):
                 0 + (window / 2 * self.sampling_interval),   self.sampling_interval,)* 1000)
         return time_sampling_window
 
+    @property
+    def _rock_velocity(self):
+        '''
+        Rock velocity driving the current component (alpha or beta).
+        '''
+        if self.component == 'axial':
+            return self.rock.alpha
+        if self.component == 'tangential':
+            return self.rock.beta
+
+    @property
+    def _rock_density(self):
+        return self.rock.rho
+
     @property
     def Zb(self):
         '''
         Elastic impedance of the rock. dens x Vp^2
         Measures compressional modulus.
         '''
-        if self.component == 'axial':
-            return (
-                ((self.pipe.Ab * self.rock.rho * self.rock.alpha) / (self.k * self.pipe.Rb))
-                / (1j - self.cot_phi))
-        if self.component == 'tangential':
-            array = (
-                ((self.pipe.Ab * self.rock.rho * self.rock.beta) / (self.k * self.pipe.Rb))
-                / (1j - self.cot_phi))
-            return array
+        return self._cached('Zb', lambda: (
+            ((self.pipe.Ab * self._rock_density * self._rock_velocity) / (self.k * self.pipe.Rb))
+            / (1j - self.cot_phi)))
 
 
     @property
@@ -158,6 +433,13 @@ class TheoreticalWavelet(object):
 
     @classmethod
     def _fill_complex_nans(cls, complex_array):
+        if complex_array.ndim > 1:
+            # One spectrum per row: the DC bin takes the first finite bin, as
+            # np.interp does for the 1-D case below.
+            nans = np.isnan(complex_array[..., 0])
+            if nans.any():
+                complex_array[nans, 0] = complex_array[nans, 1]
+            return complex_array
         if np.isnan(complex_array[0]):
             inds = np.indices(complex_array.shape).ravel()
             complex_array.real[0] = np.interp(0, inds[1:], complex_array.real[1:])
@@ -187,12 +469,14 @@ class TheoreticalWavelet(object):
         '''
 
 
-        primary_complex = (self.pipe.Z1 * self.Zb) / (self.pipe.Z1 + self.Zb)
+        def compute():
+            primary_complex = (self.pipe.Z1 * self.Zb) / (self.pipe.Z1 + self.Zb)
 
-        if not (type(self.frequencies) in (int, float)):
-            primary_complex = self._fill_complex_nans(primary_complex)
+            if not (type(self.frequencies) in (int, float)):
+                primary_complex = self._fill_complex_nans(primary_complex)
+            return primary_complex
 
-        return (primary_complex)
+        return self._cached('primary_in_frequency_domain_complex', compute, shared=True)
 
     @property
     def reflected_in_frequency_domain_complex(self):
@@ -206,10 +490,13 @@ class TheoreticalWavelet(object):
         convolved with the downgoing wave in time domain.
         '''
 
-        reflected_complex = (self.pipe.Z1 - self.Zb) / (self.pipe.Z1 + self.Zb)
-        if not (type(self.frequencies) in (int, float)):
-            reflected_complex = self._fill_complex_nans(reflected_complex)
-        return reflected_complex
+        def compute():
+            reflected_complex = (self.pipe.Z1 - self.Zb) / (self.pipe.Z1 + self.Zb)
+            if not (type(self.frequencies) in (int, float)):
+                reflected_complex = self._fill_complex_nans(reflected_complex)
+            return reflected_complex
+
+        return self._cached('reflected_in_frequency_domain_complex', compute, shared=True)
 
 
     @property
@@ -231,11 +518,13 @@ class TheoreticalWavelet(object):
 
     @classmethod
     def make_symmetry_on_complex(cls, freq_domain):
-        freq_domain_real = np.r_[freq_domain.real, freq_domain.real[:-1][::-1]][:-1]
-        freq_domain_imag = np.r_[freq_domain.imag, freq_domain.imag[:-1][::-1]][:-1]
+        freq_domain_real = np.concatenate(
+            [freq_domain.real, freq_domain.real[..., :-1][..., ::-1]], axis=-1)[..., :-1]
+        freq_domain_imag = np.concatenate(
+            [freq_domain.imag, freq_domain.imag[..., :-1][..., ::-1]], axis=-1)[..., :-1]
 
-        freq_domain_imag[int(len(freq_domain_imag) / 2) :] = -freq_domain_imag[
-            int(len(freq_domain_imag) / 2) :
+        freq_domain_imag[..., int(freq_domain_imag.shape[-1] / 2) :] = -freq_domain_imag[
+            ..., int(freq_domain_imag.shape[-1] / 2) :
         ]
         return freq_domain_real + freq_domain_imag * 1j
 
@@ -254,17 +543,61 @@ class TheoreticalWavelet(object):
     @classmethod
     def inverse_transform(cls, complex_array):
         complex_array = cls._fill_complex_nans(complex_array)
-        time_domain = np.fft.ifft(complex_array)
-        return np.fft.fftshift(time_domain)
+        time_domain = np.fft.ifft(complex_array, axis=-1)
+        return np.fft.fftshift(time_domain, axes=-1)
 
     def _wavelet_to_timedomain(self, amplitude, phase):
         complex_array = self.amp_phase2complex(amplitude, phase)
         return self.inverse_transform(complex_array)
 
+    @classmethod
+    def fold_phase(cls, complex_array):
+        '''
+        Flip the sign of the bins with a negative real part.
+
+        This is what the (amplitude, phase) round trip does, since the phase
+        is arctan(imag / real) and is folded into (-pi/2, pi/2).
+        '''
+        return np.where(complex_array.real < 0, -complex_array, complex_array)
+
+    @classmethod
+    def inverse_real_transform(cls, complex_array):
+        '''
+        Centered real time series of a one sided (0 to nyquist) spectrum.
+
+        Same output as inverse_transform(make_symmetry_on_complex(array)).real
+        without building the mirrored spectrum or the complex ifft.
+        '''
+        complex_array = cls._fill_complex_nans(complex_array)
+        number_of_samples = 2 * (complex_array.shape[-1] - 1)
+        time_domain = np.fft.irfft(complex_array, n=number_of_samples, axis=-1)
+        return np.fft.fftshift(time_domain, axes=-1)
+
+    def _spectrum_to_timedomain(self, complex_array):
+        return self.inverse_real_transform(self.fold_phase(complex_array))
+
+    def _full_time_domain(self, name, filtered=False):
+        '''
+        Full length primary or reflected time series (before windowing and
+        the axial sign flip), cached per filtering.
+        '''
+        def compute():
+            spectrum = getattr(self, '{}_in_frequency_domain_complex'.format(name))
+            if filtered and self.filter_domain == 'frequency':
+                return self.inverse_real_transform(
+                    self.fold_phase(spectrum) * self.filter_response())
+            if filtered:
+                return signal.filtfilt(self.fir_taps, 1, self._full_time_domain(name))
+            return self._spectrum_to_timedomain(spectrum)
+
+        return self._cached(
+            ('{}_in_time_domain'.format(name), bool(filtered)), compute,
+            shared=True, filtered=filtered)
+
     def get_window_from_center(self, window, array):
-        center_index = int(array.shape[0] / 2)
+        center_index = int(array.shape[-1] / 2)
         array = array[
-            center_index - int(window / 2) : center_index + int(window / 2)
+            ..., center_index - int(window / 2) : center_index + int(window / 2)
         ]
         return array
 
@@ -272,15 +605,14 @@ class TheoreticalWavelet(object):
         """
         Upcoming wavelet from the bit-rock interaction (JR).
         """
-        time_domain = self._wavelet_to_timedomain(
-            *self.primary_in_frequency_domain
-        ).real
-        if filtered:
-            time_domain = signal.filtfilt(self.fir_taps, 1, time_domain)
+        wavelet = self._grid_for(window)
+        if wavelet is not self:
+            return wavelet.primary_in_time_domain(window, resample, filtered)
+        time_domain = self._full_time_domain('primary', filtered).copy()
         if window:
             time_domain = self.get_window_from_center(window, time_domain)
         if resample:
-            return signal.resample(time_domain, resample)
+            return signal.resample(time_domain, resample, axis=-1)
         else:
             return time_domain
 
@@ -290,28 +622,32 @@ class TheoreticalWavelet(object):
         An impulse coming down from the bitsub hitting the bit-rock interface
         and coming back up (JR).
         """
-        time_domain = self._wavelet_to_timedomain(
-            *self.reflected_in_frequency_domain
-        ).real
-        if filtered:
-            time_domain = signal.filtfilt(self.fir_taps, 1, time_domain)
+        wavelet = self._grid_for(window)
+        if wavelet is not self:
+            return wavelet.reflected_in_time_domain(window, resample, filtered)
+        time_domain = self._full_time_domain('reflected', filtered).copy()
         if window:
             time_domain = self.get_window_from_center(window, time_domain)
         if resample:
-            time_domain = signal.resample(time_domain, resample)
+            time_domain = signal.resample(time_domain, resample, axis=-1)
         if self.component == 'axial':
             time_domain = -1 * time_domain
         return time_domain
 
-    def multiple_in_time_domain(self, window=None, resample=None, filtered=False):
+    def multiple_in_time_domain(self, window=None, resample=None, filtered=False,
+                                method='auto'):
         '''
         The convolution of primary and reflected wavelet (JR).
+
+        method is passed to scipy.signal.convolve: 'auto' uses an FFT
+        convolution for long (full length) wavelets, 'direct' forces the
+        O(N^2) sum.
         '''
         primary, reflected = (
             self.primary_in_time_domain(window, filtered=filtered),
             self.reflected_in_time_domain(window, filtered=filtered),
         )
-        convolved = signal.convolve(primary, reflected, mode="same", method="direct")
+        convolved = signal.convolve(primary, reflected, mode="same", method=method)
         if resample:
             return signal.resample(convolved, resample)
         else:
@@ -340,13 +676,526 @@ class TheoreticalWavelet(object):
 
     def apply_time_shift(self, array, delay_in_ms=.52):
         samples_to_shift = int((delay_in_ms / 1000) / self.sampling_interval)
-        return np.pad(array, [samples_to_shift, 0], 'linear_ramp')[:-samples_to_shift]
+        pad_width = [(0, 0)] * (np.ndim(array) - 1) + [(samples_to_shift, 0)]
+        return np.pad(array, pad_width, 'linear_ramp')[..., :-samples_to_shift]
+
+    def apply_fractional_time_shift(self, array, delay_in_ms=.52):
+        '''
+        Delay array (or each row of a stack by its own delay) by
+        delay_in_ms, fractional samples included. See
+        shift_in_frequency_domain.
+        '''
+        return shift_in_frequency_domain(array, delay_in_ms, self.sampling_interval)
 
     def apply_derivative(self, array):
-        array = np.gradient(array, self.sampling_interval)
+        array = np.gradient(array, self.sampling_interval, axis=-1)
         return array
 
 
+class BatchedTheoreticalWavelet(TheoreticalWavelet):
+    """
+    TheoreticalWavelet for a whole grid of rocks in one vectorized pass.
+
+    The rock properties are 1-D arrays (one entry per rock) and every
+    frequency domain product is broadcast to a (rock x frequency) array, so
+    the time domain methods return (rock x time) arrays computed with one
+    batched ifft along the frequency axis. Rocks are processed in blocks of
+    ``block_size`` rows to bound the memory of the full length spectra.
+
+    Args:
+        pipe (Pipe): Pipe shared by all the rocks.
+        rock (Rock): Rock whose alpha, rho and beta are arrays of equal length.
+        filter_domain (str): 'time' (filtfilt) or 'frequency' (|H(f)|^2 product).
+        block_size (int): Number of rocks transformed at once.
+    """
+
+    def __init__(self,
+                 pipe,
+                 rock,
+                 frequency_resolution=0.5,
+                 nyquist=5000,
+                 filterby=[30, 45, 160, 200],
+                 filter_duration=0.02,
+                 component='axial',
+                 filter_domain='time',
+                 block_size=128):
+
+        self.block_size = block_size
+        self._window_synthesis = None
+        self.number_of_rocks = max(
+            np.size(value) for value in (rock.alpha, rock.rho, rock.beta) if value is not None)
+
+        super(BatchedTheoreticalWavelet, self).__init__(
+            pipe, rock,
+            frequency_resolution=frequency_resolution,
+            nyquist=nyquist,
+            filterby=filterby,
+            filter_duration=filter_duration,
+            component=component,
+            filter_domain=filter_domain)
+
+    @classmethod
+    def from_grid(cls, pipe, velocities, densities, component='axial', **kwargs):
+        '''
+        Model every (velocity, density) combination, velocities varying
+        slowest as in itertools.product(velocities, densities).
+        '''
+        velocity, density = (
+            grid.ravel() for grid in np.meshgrid(
+                np.asarray(velocities, dtype=float),
+                np.asarray(densities, dtype=float),
+                indexing='ij'))
+        rock = Rock(alpha=velocity, beta=velocity, rho=density, component=component)
+        return cls(pipe, rock, component=component, **kwargs)
+
+    def __len__(self):
+        return self.number_of_rocks
+
+    def _as_column(self, value):
+        return np.broadcast_to(
+            np.asarray(value, dtype=float), (self.number_of_rocks,))[:, np.newaxis]
+
+    @property
+    def _rock_velocity(self):
+        return self._as_column(super(BatchedTheoreticalWavelet, self)._rock_velocity)
+
+    @property
+    def _rock_density(self):
+        return self._as_column(self.rock.rho)
+
+    def _take(self, rows):
+        '''
+        Batched wavelet for a slice of the rocks.
+        '''
+        def take(value):
+            if value is None:
+                return None
+            return np.broadcast_to(np.asarray(value, dtype=float), (self.number_of_rocks,))[rows]
+
+        rock = Rock(alpha=take(self.rock.alpha), rho=take(self.rock.rho),
+                    beta=take(self.rock.beta), component=self.component)
+        return self._copy_with(rock=rock)
+
+    @property
+    def parameters(self):
+        return dict(super(BatchedTheoreticalWavelet, self).parameters, block_size=self.block_size)
+
+    def _cached(self, name, compute, shared=False, filtered=False):
+        # Block spectra are never reused by another grid and would only
+        # evict the entries of single wavelets from the process-wide cache.
+        return super(BatchedTheoreticalWavelet, self)._cached(name, compute)
+
+    def _probe(self):
+        '''
+        The rocks with extreme velocity and density, the slowest ones having
+        the longest tails.
+        '''
+        velocity, density = self._rock_velocity[:, 0], self._rock_density[:, 0]
+        return self._take(np.unique(
+            [velocity.argmin(), velocity.argmax(), density.argmin(), density.argmax()]))
+
+    def for_window(self, window, filtered=True, tolerance=1e-3, minimum_samples=1024):
+        '''
+        Windowed synthesis (see TheoreticalWavelet.for_window) with the
+        frequency grid chosen block by block, so only the blocks of slow
+        rocks pay for a finer grid.
+        '''
+        windowed = self._copy_with()
+        windowed._window_synthesis = dict(
+            window=window, filtered=filtered, tolerance=tolerance,
+            minimum_samples=minimum_samples)
+        windowed._synthesis = (window, self)
+        return windowed
+
+    def blocks(self):
+        '''
+        Batched wavelets of at most block_size rocks, built once per wavelet
+        (the windowed synthesis grid of each block is only searched once).
+        '''
+        def compute():
+            if self.number_of_rocks <= self.block_size:
+                blocks = [self]
+            else:
+                blocks = [
+                    self._take(slice(start, start + self.block_size))
+                    for start in range(0, self.number_of_rocks, self.block_size)]
+            if self._window_synthesis:
+                blocks = [TheoreticalWavelet.for_window(block, **self._window_synthesis)
+                          for block in blocks]
+            return blocks
+
+        return self._cached('blocks', compute)
+
+    def _release(self, block):
+        '''
+        Drop the full length products of a block once its rows are done.
+        '''
+        if block is not self:
+            block._cache = {}
+            block._cache_state = None
+
+    def _filtered_window(self, block, name, window):
+        '''
+        Time domain filtered window of a block, filtering only the window
+        and a margin of two filter lengths on each side: the output of the
+        FIR filtfilt in the window only depends on the samples within one
+        filter length, so this matches filtering the full series.
+        '''
+        full = block._full_time_domain(name)
+        margin = 2 * len(block.fir_taps)
+        if window + 2 * margin >= full.shape[-1]:
+            return getattr(TheoreticalWavelet, '{}_in_time_domain'.format(name))(
+                block, window, filtered=True)
+        cropped = block.apply_filter(block.get_window_from_center(window + 2 * margin, full))
+        time_domain = np.ascontiguousarray(cropped[..., margin:-margin])
+        if name == 'reflected' and block.component == 'axial':
+            time_domain = -1 * time_domain
+        return time_domain
+
+    def _windowed(self, names, window, filtered):
+        '''
+        Primary and/or reflected windows of every rock, computed together
+        block by block (the blocks share their impedances) and cached on
+        this wavelet so the multiple reuses them. The blocks of a for_window
+        synthesis are on their own grids, so wider windows (or none) are read
+        from the full grid wavelet.
+        '''
+        wavelet = self._grid_for(window)
+        if wavelet is not self:
+            return wavelet._windowed(names, window, filtered)
+        filtered = bool(filtered and self.filterby)
+        keys = dict((name, ('windowed', name, window, filtered)) for name in names)
+        if window and self._cache_key == self._cache_state:
+            missing = [name for name in names if keys[name] not in self._cache]
+        else:
+            missing = list(names)
+
+        rows = dict((name, []) for name in missing)
+        if missing:
+            for block in self.blocks():
+                for name in missing:
+                    if filtered and window and block.filter_domain == 'time':
+                        rows[name].append(self._filtered_window(block, name, window))
+                    else:
+                        # Copy the window out of the full length series.
+                        rows[name].append(np.ascontiguousarray(getattr(
+                            TheoreticalWavelet, '{}_in_time_domain'.format(name))(
+                                block, window, filtered=filtered)))
+                self._release(block)
+        windows = dict((name, np.concatenate(rows[name])) for name in missing)
+        if not window:
+            return [windows[name] for name in names]
+        return [self._cached(keys[name], lambda: windows[name]) for name in names]
+
+    def primary_in_time_domain(self, window=None, resample=None, filtered=False):
+        """
+        Upcoming wavelets from the bit-rock interaction, (rock x time).
+        """
+        time_domain = np.array(self._windowed(['primary'], window, filtered)[0])
+        if resample:
+            return signal.resample(time_domain, resample, axis=-1)
+        return time_domain
+
+    def reflected_in_time_domain(self, window=None, resample=None, filtered=False):
+        """
+        Reflected wavelets at the bit-rock interface, (rock x time).
+        """
+        time_domain = np.array(self._windowed(['reflected'], window, filtered)[0])
+        if resample:
+            return signal.resample(time_domain, resample, axis=-1)
+        return time_domain
+
+    def pegleg_rocksteel(self, delay_in_ms=.52, RC=-.357, window=100):
+        '''
+        Pegleg of every rock: delayed and scaled multiples, (rock x time).
+        delay_in_ms and RC are scalars or one value per rock, and delays
+        may be fractional samples.
+        '''
+        multiple = self.multiple_in_time_domain(window, filtered=False)
+        return self.pegleg_steelsteel(multiple, delay_in_ms=delay_in_ms, RC=RC)
+
+    def pegleg_steelsteel(self, array, delay_in_ms=.52, RC=-.357, window=100):
+        pegleg = self.apply_fractional_time_shift(array, delay_in_ms=delay_in_ms)
+        return self.apply_RC(pegleg, RC)
+
+    def apply_RC(self, array, RC):
+        '''
+        Scale each row of array by its RC (scalar or one value per row).
+        '''
+        return array * np.asarray(RC)[..., np.newaxis]
+
+    def multiple_in_time_domain(self, window=None, resample=None, filtered=False,
+                                method='fft'):
+        '''
+        Row-wise convolution of the primary and reflected wavelets, (rock x time).
+        Always done with FFTs, method is accepted for compatibility.
+        '''
+        primary, reflected = self._windowed(['primary', 'reflected'], window, filtered)
+        convolved = np.concatenate([
+            signal.fftconvolve(primary[start:start + self.block_size],
+                               reflected[start:start + self.block_size], mode="same", axes=-1)
+            for start in range(0, self.number_of_rocks, self.block_size)])
+        if resample:
+            return signal.resample(convolved, resample, axis=-1)
+        else:
+            return convolved
+
+
+# Reflection coefficients and delays (ms) of the bit sub, the pipe
+# connections and the top sub, for a single pipe (JR's multipass model).
+DRILL_STRING_DEFAULTS = {
+    'axial': dict(
+        bitsub_rc=0.293,
+        bitsub_delay_in_ms=0.421,
+        connector_rc=0.086,
+        connector_delay_in_ms=0.250,
+        topsub_rc=-0.55,
+        multiple_rcs=(-0.293, 0.707, 0.207),
+        multiple_delay_in_ms=6.095,
+    ),
+    'tangential': dict(
+        bitsub_rc=-0.120,
+        bitsub_delay_in_ms=0.867,
+        connector_rc=0.0144,
+        connector_delay_in_ms=0.515,
+        topsub_rc=0.55,
+        multiple_rcs=(0.120, 0.880, 0.106),
+        multiple_delay_in_ms=12.548,
+    ),
+}
+
+
+# Two-way delays (ms) per added pipe of the notebooks (DELAY_AXIAL_PIPE and
+# DELAY_TANGENTIAL_PIPE). DrillString derives its delay from the pipe length
+# and velocity instead, unless given pipe_delay_in_ms.
+NOTEBOOK_PIPE_DELAYS = {'axial': 5.627, 'tangential': 11.584}
+
+
+def _delay_operator(frequencies, delay_in_ms):
+    return np.exp(-2j * np.pi * frequencies * delay_in_ms / 1000)
+
+
+class DrillStringLibrary(object):
+    """
+    Precomputed drill string transfer functions keyed by pipe count and
+    geometry (reflection coefficients, delays and frequency grid).
+
+    A string of N pipes is built from the longest cached shorter string of
+    the same geometry by multiplying in the per-pipe transfer function, so
+    changing the rod count only costs one spectral product per added pipe.
+    """
+
+    def __init__(self):
+        self._responses = {}
+
+    @classmethod
+    def _key(cls, drill_string, frequencies, num_pipes):
+        return (freeze(drill_string.geometry), len(frequencies),
+                float(frequencies[-1]), int(num_pipes))
+
+    def __len__(self):
+        return len(self._responses)
+
+    def __contains__(self, key):
+        return key in self._responses
+
+    def keys(self):
+        return self._responses.keys()
+
+    def get(self, drill_string, frequencies, num_pipes=None):
+        '''
+        (connectors, travel) transfer functions of a string of num_pipes
+        (defaults to drill_string.num_pipes) pipes.
+        '''
+        num_pipes = drill_string.num_pipes if num_pipes is None else int(num_pipes)
+        key = self._key(drill_string, frequencies, num_pipes)
+        if key in self._responses:
+            return self._responses[key]
+
+        shorter = [
+            n for n in range(num_pipes - 1, 0, -1)
+            if self._key(drill_string, frequencies, n) in self._responses]
+        if shorter:
+            count = shorter[0]
+            connectors, travel = self._responses[self._key(drill_string, frequencies, count)]
+        else:
+            count = 1
+            connectors, travel = drill_string.single_pipe_transfer_function(frequencies)
+            self._store(self._key(drill_string, frequencies, 1), connectors, travel)
+
+        pipe_connector, pipe_travel = drill_string.pipe_transfer_function(frequencies)
+        while count < num_pipes:
+            connectors, travel = connectors * pipe_connector, travel * pipe_travel
+            count += 1
+            self._store(self._key(drill_string, frequencies, count), connectors, travel)
+        return connectors, travel
+
+    def _store(self, key, connectors, travel):
+        connectors.setflags(write=False)
+        travel.setflags(write=False)
+        self._responses[key] = (connectors, travel)
+
+    def precompute(self, drill_string, frequencies, max_pipes):
+        '''
+        Fill the library with strings of 1 to max_pipes pipes.
+        '''
+        self.get(drill_string, frequencies, max_pipes)
+
+    def clear(self):
+        self._responses.clear()
+
+
+drill_string_library = DrillStringLibrary()
+
+
+class DrillString(object):
+    """
+    Drill string of num_pipes identical pipes between the sensor (top sub)
+    and the bit sub, producing the multiple train seen at the sensor.
+
+    In frequency domain, with P and R the primary and reflected spectra of
+    a TheoreticalWavelet:
+
+        P0 = P (1 + bitsub_rc R D(bitsub)) C ** (num_pipes - 1)
+        C = 1 + connector_rc D(connector)
+        L = topsub_rc S (rc_a + rc_b R D(bitsub) + rc_c R^2 D(2 bitsub))
+        S = D(multiple_delay + (num_pipes - 1) pipe_delay)
+        Mk = P0 L ** k
+
+    where D(t) is a delay of t ms and (rc_a, rc_b, rc_c) = multiple_rcs.
+    For the tangential component P is differentiated first, as the
+    notebooks do with apply_derivative. Adding a pipe multiplies C and S by
+    the per-pipe transfer function.
+
+    Args:
+        pipe (Pipe): Pipe of the string. The two-way delay per pipe defaults
+            to 2 x pipe.length / pipe velocity (alpha or beta): 4.7 ms axial
+            and 9.0 ms tangential for the notebooks' 12 m pipe (alpha 5100,
+            beta 2668), where the notebooks
+            use NOTEBOOK_PIPE_DELAYS (5.627 and 11.584 ms). Pass
+            pipe_delay_in_ms=NOTEBOOK_PIPE_DELAYS[component] to reproduce
+            them.
+        num_pipes (int): Number of pipes (rod sequence).
+        component (str): 'axial' or 'tangential', selects the defaults.
+        pipe_delay_in_ms (float): Two-way delay of one pipe, overrides the
+            pipe length and velocity.
+        library (DrillStringLibrary): Where string transfer functions are
+            cached, defaults to the module-level drill_string_library.
+        **reflectors: Overrides of DRILL_STRING_DEFAULTS[component].
+    """
+
+    def __init__(self, pipe, num_pipes=1, component='axial', pipe_delay_in_ms=None,
+                 library=None, **reflectors):
+        unknown = set(reflectors) - set(DRILL_STRING_DEFAULTS[component])
+        if unknown:
+            raise TypeError('Unknown drill string arguments: {}'.format(', '.join(sorted(unknown))))
+
+        self.pipe = pipe
+        self.num_pipes = num_pipes
+        self.component = component
+        self._pipe_delay_in_ms = pipe_delay_in_ms
+        self.library = drill_string_library if library is None else library
+        for name, value in dict(DRILL_STRING_DEFAULTS[component], **reflectors).items():
+            setattr(self, name, value)
+
+    @property
+    def pipe_delay_in_ms(self):
+        if self._pipe_delay_in_ms is not None:
+            return self._pipe_delay_in_ms
+        velocity = self.pipe.alpha if self.component == 'axial' else self.pipe.beta
+        return 2 * self.pipe.length / velocity * 1000
+
+    @property
+    def geometry(self):
+        '''
+        Everything but the pipe count.
+        '''
+        geometry = dict((name, getattr(self, name)) for name in DRILL_STRING_DEFAULTS[self.component])
+        geometry.update(component=self.component, pipe_delay_in_ms=self.pipe_delay_in_ms)
+        return geometry
+
+    def pipe_transfer_function(self, frequencies):
+        '''
+        (connector, travel) factors added by one more pipe.
+        '''
+        return (1 + self.connector_rc * _delay_operator(frequencies, self.connector_delay_in_ms),
+                _delay_operator(frequencies, self.pipe_delay_in_ms))
+
+    def single_pipe_transfer_function(self, frequencies):
+        return (np.ones(len(frequencies), dtype=complex),
+                _delay_operator(frequencies, self.multiple_delay_in_ms))
+
+    def transfer_function(self, frequencies, num_pipes=None):
+        '''
+        (connectors, travel) transfer functions of the string, from the library.
+        '''
+        return self.library.get(self, frequencies, num_pipes)
+
+    def multiple_train_in_frequency_domain(self, wavelet, num_multiples=1, num_pipes=None):
+        '''
+        Spectra [P0, M1, ..., Mk] at the sensor for a TheoreticalWavelet (or
+        a BatchedTheoreticalWavelet, giving (rock x frequency) spectra).
+        '''
+        frequencies = wavelet.frequencies
+        primary = wavelet.fold_phase(wavelet.primary_in_frequency_domain_complex)
+        # Convolving with the reflected wavelet, as signal.convolve(mode="same")
+        # does on the even length centered series, also lags by one sample.
+        reflected = wavelet.fold_phase(wavelet.reflected_in_frequency_domain_complex) * (
+            _delay_operator(frequencies, wavelet.sampling_interval * 1000))
+        if wavelet.component == 'axial':
+            reflected = -1 * reflected
+
+        if self.component == 'tangential':
+            # The notebooks differentiate the tangential primary and pegleg
+            # (apply_derivative): the central difference of np.gradient.
+            dt = wavelet.sampling_interval
+            primary = primary * (1j * np.sin(2 * np.pi * frequencies * dt) / dt)
+
+        connectors, travel = self.transfer_function(frequencies, num_pipes)
+        bitsub = _delay_operator(frequencies, self.bitsub_delay_in_ms)
+        rc_a, rc_b, rc_c = self.multiple_rcs
+
+        train = [primary * (1 + self.bitsub_rc * reflected * bitsub) * connectors]
+        round_trip = self.topsub_rc * travel * (
+            rc_a + rc_b * reflected * bitsub + rc_c * (reflected * bitsub) ** 2)
+        for _ in range(num_multiples):
+            train.append(train[-1] * round_trip)
+        return train
+
+    def multiple_train_in_time_domain(self, wavelet, num_multiples=1, num_pipes=None,
+                                      window=None, filtered=False):
+        '''
+        Time series [P0, M1, ..., Mk] at the sensor, centered like the
+        wavelet's time domain outputs.
+        '''
+        train = []
+        for spectrum in self.multiple_train_in_frequency_domain(wavelet, num_multiples, num_pipes):
+            if filtered:
+                spectrum = spectrum * wavelet.filter_response()
+            time_domain = wavelet.inverse_real_transform(spectrum)
+            if window:
+                time_domain = wavelet.get_window_from_center(window, time_domain)
+            train.append(time_domain)
+        return train
+
+    def response_in_time_domain(self, wavelet, num_multiples=1, num_pipes=None,
+                                window=None, filtered=False):
+        '''
+        Sum of the multiple train: P0 + M1 + ... + Mk.
+        '''
+        spectrum = sum(self.multiple_train_in_frequency_domain(wavelet, num_multiples, num_pipes))
+        if filtered:
+            spectrum = spectrum * wavelet.filter_response()
+        time_domain = wavelet.inverse_real_transform(spectrum)
+        if window:
+            time_domain = wavelet.get_window_from_center(window, time_domain)
+        return time_domain
+
+    def __repr__(self):
+        return '< DrillString | {} | Pipes: {} | Pipe delay: {:.3f} ms >'.format(
+            self.component, self.num_pipes, self.pipe_delay_in_ms)
+
+
 class Modeling(object):
     def __init__(self, rho_range=None, alpha_range=None, beta_range=None, pipe=None):
         pass
@@ -1,11 +1,15 @@
 import logging
 import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
 from itertools import product
 from .utils import GetterClass
 from .constants import (
     COMPONENTS,
+    FEATURE_FALLBACKS,
     FEATURES,
     RECIPES,
+    SEPARATOR,
     TEMPLATE,
     WINDOWS,
     get_feature_string,
@@ -30,94 +34,590 @@ def iterate_features():
         )
 
 
+class ColumnIndex(object):
+    """
+    Maps (recipe, component, window, feature) slots to the dataframe columns
+    holding them. Column names are split on the TEMPLATE separator once and
+    the time_pick and amplitude fallbacks are resolved up front, so a lookup
+    is a single dict access. Use ColumnIndex.for_columns to share an index
+    between dataframes with the same schema.
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+
+        parsed = {}
+        for column in self.columns:
+            if not isinstance(column, str):
+                continue
+            parts = tuple(column.split(SEPARATOR, 3))
+            if len(parts) == 4:
+                parsed[parts] = column
+
+        slots = {}
+        for slot, column in parsed.items():
+            if slot[3] in FEATURES:
+                slots[slot] = column
+
+        for window in set(slot[:3] for slot in parsed):
+            for feature, fallbacks in FEATURE_FALLBACKS.items():
+                if window + (feature,) in slots:
+                    continue
+                for fallback in fallbacks:
+                    column = parsed.get(window + (fallback,))
+                    if column is not None:
+                        slots[window + (feature,)] = column
+                        break
+
+        self.slots = slots
+
+    @classmethod
+    def for_columns(cls, columns):
+        """
+        Shared index for a schema, built on first use.
+        """
+        if hasattr(columns, "tolist"):
+            # Much faster than iterating a pandas Index.
+            columns = columns.tolist()
+        return _column_index(tuple(columns))
+
+    def get(self, recipe, component, window, feature):
+        """
+        Column name for the slot, or None if the schema does not have it.
+        """
+        return self.slots.get((recipe, component, window, feature))
+
+    def __contains__(self, slot):
+        return tuple(slot) in self.slots
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __repr__(self):
+        return "< ColumnIndex | Columns: {} | Slots: {} >".format(
+            len(self.columns), len(self.slots)
+        )
+
+
+@lru_cache(maxsize=64)
+def _column_index(columns):
+    return ColumnIndex(columns)
+
+
+class _FeatureGetter(GetterClass):
+    """
+    GetterClass node whose children (recipe > component > window > feature)
+    are resolved on first access and then kept as plain attributes.
+    """
+
+    def __init__(self, resolve, path, labels=None):
+        GetterClass.__init__(self, *(labels or path))
+        self._resolve = resolve
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        value = self._resolve(self._path + (name,))
+        setattr(self, name, value)
+        return value
+
+
+class _DerivedProperty(property):
+    """
+    Property computed once per RhinoPhysics instance. ``requires`` lists the
+    derived properties and feature paths (component.window.feature) it reads.
+    """
+
+    def __init__(self, function, requires):
+        name = function.__name__
+
+        def getter(instance):
+            if name not in instance._derived:
+                # Reading the features may join appended rows and reset the
+                # cache, so it is looked up again after the function runs.
+                value = function(instance)
+                instance._derived[name] = value
+            return instance._derived[name]
+
+        property.__init__(self, getter, doc=function.__doc__)
+        self.name = name
+        self.requires = requires
+
+
+def derived(*requires):
+    """
+    Declares a memoized RhinoPhysics derived property and its dependencies.
+    """
+
+    def decorator(function):
+        return _DerivedProperty(function, requires)
+
+    return decorator
+
+
+@lru_cache(maxsize=256)
+def _detect_capabilities(cls, column_index, recipe, components):
+    """
+    Feature columns each derived property of cls misses (directly or through
+    its dependencies) for a schema, recipe and set of components. Empty for
+    the supported properties.
+    """
+    missing = {}
+    for name in cls.evaluation_order(cls.derived_properties()):
+        absent = []
+        for requirement in getattr(cls, name).requires:
+            if "." not in requirement:
+                absent.extend(missing[requirement])
+                continue
+            component, window, feature = requirement.split(".")
+            if (
+                component not in components
+                or column_index.get(recipe, component, window, feature) is None
+            ):
+                absent.append(get_feature_string(recipe, component, window, feature))
+        missing[name] = tuple(sorted(set(absent)))
+    return OrderedDict((name, missing[name]) for name in cls.derived_properties())
+
+
+def _number_of_rows(data):
+    if isinstance(data, dict):
+        return len(next(iter(data.values()), ()))
+    return len(data)
+
+
+def _concatenate(chunks):
+    """
+    Joins dataframes, dicts of arrays or structured arrays row wise. Columns
+    missing from some of the chunks are filled with NaN.
+    """
+    first = chunks[0]
+    if isinstance(first, dict):
+        names = []
+        for chunk in chunks:
+            names.extend(name for name in chunk if name not in names)
+        return dict(
+            (
+                name,
+                np.concatenate(
+                    [
+                        chunk[name]
+                        if name in chunk
+                        else np.full(_number_of_rows(chunk), np.nan)
+                        for chunk in chunks
+                    ]
+                ),
+            )
+            for name in names
+        )
+    if isinstance(first, np.ndarray):
+        from numpy.lib import recfunctions
+
+        return recfunctions.stack_arrays(chunks, usemask=False, autoconvert=True)
+    import pandas as pd
+
+    return pd.concat(chunks)
+
+
+NULLABLE_DTYPES = ["Float32", "Float64"]
+
+
+def _numpy_float(dtype):
+    """
+    Numpy float dtype of dtype, including the pandas nullable "Float32" and
+    "Float64".
+    """
+    try:
+        return np.dtype(dtype)
+    except TypeError:
+        return np.dtype(str(dtype).lower())
+
+
+def _column_names(data):
+    if isinstance(data, np.ndarray):
+        return data.dtype.names or ()
+    if isinstance(data, dict):
+        return list(data)
+    return data.columns
+
+
 class RhinoPhysics(object):
     """
+    Second layer features of a Rhino dataframe.
+
+    With backend="numpy" the feature columns are read as contiguous float
+    arrays and the derived properties are computed without pandas index
+    alignment; dataframe may then also be a dict of arrays or a structured
+    array.
+
+    With kernel set ("numexpr", "numpy" or "auto" for numexpr when it is
+    installed) compute evaluates the formula table of theory.kernels instead
+    of the properties, fusing each output into one pass over the rows.
+
+    Derived properties are computed and stored in dtype (float32 by default,
+    "Float32"/"Float64" for pandas nullable columns); dtype_report compares
+    them with float64.
     """
 
+    BACKENDS = ["pandas", "numpy"]
+
     def __init__(
-        self, dataframe, config={}, use_recipe="J2", components_to_process=None
+        self,
+        dataframe,
+        config={},
+        use_recipe="J2",
+        components_to_process=None,
+        column_index=None,
+        backend="pandas",
+        kernel=None,
+        dtype=np.float32,
     ):
 
         # dataframe = amplitude_zero_to_nan(dataframe)
 
+        if backend not in self.BACKENDS:
+            raise ValueError(
+                "backend must be one of {}, got {}".format(self.BACKENDS, backend)
+            )
+        if backend == "pandas" and not hasattr(dataframe, "columns"):
+            raise ValueError("The pandas backend needs a dataframe")
+
         self.dataframe = dataframe
+        self.backend = backend
+        self.kernel = kernel
+        self.dtype = dtype
+        self._float = _numpy_float(dtype)
+        self._nullable = str(dtype) in NULLABLE_DTYPES
         self.config = config
         self.current_recipe = use_recipe
         self._is_populated = False
-
-        recipes = GetterClass(*RECIPES)
+        self._derived = {}
 
         if components_to_process is not None:
             self.components_to_process = components_to_process
         else:
             self.components_to_process = COMPONENTS
 
-        for recipe in RECIPES:
-            components = GetterClass(recipe)
-            for component in self.components_to_process:
-                windows = GetterClass(recipe, component)
-                for window in WINDOWS:
-                    features = GetterClass(recipe, component, window)
-                    for feature in FEATURES:
-                        string = get_feature_string(
-                            recipe=recipe,
-                            component=component,
-                            window=window,
-                            feature=feature,
-                        )
-                        if string in self.dataframe.columns:
-                            setattr(features, feature, self.dataframe[string].view())
-                        elif feature == "time_pick":
-                            for replace_string in [
-                                "maximum_time",
-                                "max_time",
-                                "zero_crossing_time",
-                                "zero_crossing_positive_slope",
-                                "zero_crossing_negative_slope",
-                                "minimum_time",
-                                "min_time",
-                            ]:
-
-                                replaced_string = string.replace(
-                                    "time_pick", replace_string
-                                )
-                                if replaced_string in self.dataframe.columns:
-                                    setattr(
-                                        features,
-                                        feature,
-                                        self.dataframe[replaced_string].view(),
-                                    )
-                                    break
-                        elif feature == "amplitude":
-                            for replace_string in [
-                                "integrated_absolute_amplitude",
-                                "maximum_amplitude",
-                                "max_amplitude",
-                            ]:
-
-                                replaced_string = string.replace(
-                                    "amplitude", replace_string
-                                )
-                                if replaced_string in self.dataframe.columns:
-                                    setattr(
-                                        features,
-                                        feature,
-                                        self.dataframe[replaced_string].view(),
-                                    )
-                                    break
-                    setattr(windows, window, features)
-                setattr(components, component, windows)
-            setattr(recipes, recipe, components)
-
-        self.recipes = recipes
+        if column_index is None:
+            column_index = ColumnIndex.for_columns(_column_names(self.dataframe))
+        self.column_index = column_index
+
+        self._missing = _detect_capabilities(
+            type(self),
+            self.column_index,
+            self.current_recipe,
+            tuple(self.components_to_process),
+        )
+
+        self._reset()
+
+    def _reset(self):
+        """
+        Drops the memoized derived properties and feature getters.
+        """
+        self._derived.clear()
+        self.recipes = _FeatureGetter(self._resolve, (), RECIPES)
         for component in self.components_to_process:
-            setattr(self, component, getattr(recipes[self.current_recipe], component))
+            setattr(self, component, getattr(self.recipes[self.current_recipe], component))
+
+    @property
+    def dataframe(self):
+        if len(self._chunks) > 1:
+            self._chunks = [_concatenate(self._chunks)]
+            self._reset()
+        return self._chunks[0]
+
+    @dataframe.setter
+    def dataframe(self, value):
+        self._chunks = [value]
+        if hasattr(self, "recipes"):
+            self._reset()
+
+    def append(self, rows, outputs=None):
+        """
+        Adds new feature rows (same type and schema as dataframe) with their
+        derived properties computed, leaving the existing rows and results
+        untouched. Only the new rows are evaluated and the cached column
+        index and capabilities of the schema are reused, so the cost follows
+        the number of new rows. The rows are joined to dataframe the next time
+        it is read.
+
+        Returns:
+            The populated new rows.
+        """
+        physics = type(self)(
+            rows,
+            config=self.config,
+            use_recipe=self.current_recipe,
+            components_to_process=self.components_to_process,
+            backend=self.backend,
+            kernel=self.kernel,
+            dtype=self.dtype,
+        )
+        physics._populate(outputs)
+        self._chunks.append(physics.dataframe)
+        # The warmed feature getters hold the columns of the old rows.
+        self._reset()
+        return physics.dataframe
+
+    def _resolve(self, path):
+        """
+        Child of the getter node at path[:-1]: another node above the feature
+        level, the feature column otherwise.
+        """
+        levels = (RECIPES, self.components_to_process, WINDOWS, FEATURES)
+        name = path[-1]
+        if name not in levels[len(path) - 1]:
+            raise AttributeError(
+                "< {} > has no attribute {}".format(" | ".join(path[:-1]), name)
+            )
+        if len(path) < 4:
+            return _FeatureGetter(self._resolve, path)
+        column = self.column_index.get(*path)
+        if column is None:
+            raise AttributeError(
+                "No column for {}".format(get_feature_string(*path))
+            )
+        if self.backend == "numpy":
+            return self._feature_array(column)
+        series = self.dataframe[column]
+        if series.dtype == self._float:
+            return series.view()
+        return series.astype(self._float)
+
+    def _feature_array(self, column):
+        return np.ascontiguousarray(self.dataframe[column], dtype=self._float)
+
+    def __len__(self):
+        return sum(_number_of_rows(chunk) for chunk in self._chunks)
 
     def __getitem__(self, name):
-        return self.dataframe[name].values
+        return np.asarray(self.dataframe[name])
 
     def __setitem__(self, name, value):
         self.dataframe[name] = value
+        # The warmed feature getters hold the column that was replaced.
+        self._reset()
+
+    @classmethod
+    def derived_properties(cls):
+        """
+        Names of all the derived properties, in populate order.
+        """
+        return [
+            name
+            for name in dir(cls)
+            if isinstance(getattr(cls, name, None), _DerivedProperty)
+        ]
+
+    @classmethod
+    def evaluation_order(cls, outputs):
+        """
+        Derived properties needed to compute outputs, dependencies first.
+        """
+        order = []
+
+        def visit(name):
+            if name in order:
+                return
+            prop = getattr(cls, name, None)
+            if not isinstance(prop, _DerivedProperty):
+                raise ValueError("Unknown derived property {}".format(name))
+            for requirement in prop.requires:
+                if "." not in requirement:
+                    visit(requirement)
+            order.append(name)
+
+        for name in outputs:
+            visit(name)
+        return order
+
+    @property
+    def supported(self):
+        """
+        Derived properties the dataframe columns can support.
+        """
+        return [name for name, missing in self._missing.items() if not missing]
+
+    def capability_report(self):
+        """
+        For each derived property, whether it can be computed from the
+        dataframe columns and which feature columns it misses otherwise.
+        """
+        return OrderedDict(
+            (name, dict(supported=not missing, missing=list(missing)))
+            for name, missing in self._missing.items()
+        )
+
+    def _default_outputs(self):
+        prefixes = {"axial": "a_", "tangential": "t_", "radial": "r_"}
+        skipped = tuple(
+            prefix
+            for component, prefix in prefixes.items()
+            if component not in self.components_to_process
+        )
+        return [
+            name for name in self.derived_properties() if not name.startswith(skipped)
+        ]
+
+    def required_columns(self, outputs=None):
+        """
+        Dataframe columns read when computing outputs (all of the default
+        outputs when None).
+        """
+        if outputs is None:
+            outputs = self._default_outputs()
+        columns = []
+        for name in self.evaluation_order(outputs):
+            for requirement in getattr(type(self), name).requires:
+                if "." not in requirement:
+                    continue
+                column = self.column_index.get(
+                    self.current_recipe, *requirement.split(".")
+                )
+                if column is not None and column not in columns:
+                    columns.append(column)
+        return columns
+
+    def compute(self, outputs=None):
+        """
+        Evaluates the requested derived properties (all of those for the
+        processed components by default) and returns them by name. Shared
+        intermediates are computed once; outputs the columns do not support
+        (see capability_report) are left out.
+        """
+        if outputs is None:
+            outputs = self._default_outputs()
+        for name in outputs:
+            if name not in self._missing:
+                raise ValueError("Unknown derived property {}".format(name))
+        skipped = [name for name in outputs if self._missing[name]]
+        if skipped:
+            logger.debug("Skipping unsupported {}.".format(", ".join(skipped)))
+        outputs = [name for name in outputs if not self._missing[name]]
+
+        if self.kernel is not None:
+            return self._compute_kernel(outputs)
+        self._derived.clear()
+        for name in self.evaluation_order(outputs):
+            getattr(self, name)
+        return OrderedDict(
+            (name, self._derived[name].astype(self._float, copy=False))
+            for name in outputs
+        )
+
+    def _compute_kernel(self, outputs):
+        from . import kernels
+
+        engine = None if self.kernel == "auto" else self.kernel
+        results = {}
+        for component in self.components_to_process:
+            prefix = kernels.COMPONENT_PREFIXES[component]
+            formulas = OrderedDict(kernels.FORMULAS)
+            if component == "axial":
+                formulas.update(kernels.AXIAL_FORMULAS)
+            names = dict(
+                (name, name if name in kernels.AXIAL_FORMULAS else prefix + "_" + name)
+                for name in formulas
+            )
+            wanted = [name for name in formulas if names[name] in outputs]
+            if not wanted:
+                continue
+
+            columns = OrderedDict()
+            for token, (window, feature) in kernels.FORMULA_INPUTS.items():
+                column = self.column_index.get(
+                    self.current_recipe, component, window, feature
+                )
+                if column is not None:
+                    columns[token] = column
+            inputs = dict(
+                (token, self._feature_array(columns[token]))
+                for token in kernels.required_inputs(formulas, columns, wanted)
+            )
+
+            for name, value in kernels.evaluate(
+                formulas, inputs, wanted, engine, self._float
+            ).items():
+                results[names[name]] = value
+
+        return OrderedDict((name, results[name]) for name in outputs if name in results)
+
+    def compute_all(self, recipes=None, components=None, outputs=None):
+        """
+        Derived physics of several recipes and components (radial included)
+        in one pass. The feature columns of all the (recipe, component) pairs
+        sharing a schema are stacked and every formula of theory.kernels is
+        evaluated once over the stack.
+
+        Args:
+            recipes (list): Recipes to evaluate (RECIPES by default).
+            components (list): Components to evaluate (components_to_process
+                by default).
+            outputs (list): Formula names (e.g. "density", "c_modulus_p") to
+                return, all of them by default.
+
+        Returns:
+            pd.DataFrame: One column per (recipe, component, property). Pairs
+            missing the inputs of a property are left out.
+        """
+        import pandas as pd
+        from . import kernels
+
+        recipes = recipes or RECIPES
+        components = components or self.components_to_process
+        engine = None if self.kernel in (None, "auto") else self.kernel
+        formula_names = list(kernels.FORMULAS) + list(kernels.AXIAL_FORMULAS)
+        if outputs is not None:
+            for name in outputs:
+                if name not in formula_names:
+                    raise ValueError("Unknown formula {}".format(name))
+
+        groups = OrderedDict()
+        for recipe, component in product(recipes, components):
+            columns = OrderedDict()
+            for token, (window, feature) in kernels.FORMULA_INPUTS.items():
+                column = self.column_index.get(recipe, component, window, feature)
+                if column is not None:
+                    columns[token] = column
+            if columns:
+                key = (component == "axial", tuple(columns))
+                groups.setdefault(key, []).append(((recipe, component), columns))
+
+        results = {}
+        for (axial, tokens), pairs in groups.items():
+            formulas = OrderedDict(kernels.FORMULAS)
+            if axial:
+                formulas.update(kernels.AXIAL_FORMULAS)
+            wanted = None if outputs is None else [n for n in outputs if n in formulas]
+            inputs = dict(
+                (token, np.stack([self._feature_array(columns[token]) for _, columns in pairs]))
+                for token in kernels.required_inputs(formulas, tokens, wanted)
+            )
+            for name, value in kernels.evaluate(
+                formulas, inputs, wanted, engine, self._float
+            ).items():
+                for (pair, _), row in zip(pairs, value):
+                    results[pair + (name,)] = row
+
+        keys = [
+            (recipe, component, name)
+            for recipe in recipes
+            for component in components
+            for name in (outputs or formula_names)
+            if (recipe, component, name) in results
+        ]
+        block = np.empty((len(keys), len(self)), dtype=self._float)
+        for row, key in zip(block, keys):
+            row[:] = results[key]
+        index = getattr(self.dataframe, "index", None)
+        return pd.DataFrame(
+            block.T,
+            index=index,
+            columns=pd.MultiIndex.from_tuples(
+                keys, names=["recipe", "component", "property"]
+            ),
+        )
 
     @property
     def _is_rhino(self):
@@ -126,286 +626,304 @@ class RhinoPhysics(object):
         """
         return _is_rhino_dataframe(self.dataframe)
 
-    @property
+    @derived("axial.multiple_1.time_pick", "axial.primary.time_pick")
     def a_delay_1(self):
         return self.axial.multiple_1.time_pick - self.axial.primary.time_pick
 
-    @property
+    @derived("axial.multiple_2.time_pick", "axial.multiple_1.time_pick")
     def a_delay_2(self):
         return self.axial.multiple_2.time_pick - self.axial.multiple_1.time_pick
 
-    @property
+    @derived("a_modulus_r_1", "a_modulus_v_1")
     def a_density(self):
         return self.a_modulus_r_1 / (self.a_modulus_v_1 ** 2)
 
-    @property
+    @derived("axial.primary.amplitude", "axial.multiple_1.amplitude")
     def a_ratio(self):
         return self.axial.primary.amplitude / self.axial.multiple_1.amplitude
 
-    @property
+    @derived("a_ratio")
     def a_ratio_1(self):
         return self.a_ratio
 
-    @property
+    @derived("axial.multiple_1.amplitude", "axial.multiple_2.amplitude")
     def a_ratio_2(self):
         return self.axial.multiple_1.amplitude / self.axial.multiple_2.amplitude
 
-    @property
+    @derived("axial.multiple_1.jazz1_left_integrated_amplitude")
     def a_jazz_left(self):
-        try:
-            return (
-                self.axial.multiple_1.jazz1_left_integrated_amplitude
-            )
-        except:
-            return np.nan
+        return (
+            self.axial.multiple_1.jazz1_left_integrated_amplitude
+        )
 
-    @property
+    @derived("axial.multiple_1.jazz1_right_integrated_amplitude")
     def a_jazz_right(self):
-        try:
-            return (
-                self.axial.multiple_1.jazz1_right_integrated_amplitude
-            )
-        except:
-            return np.nan
+        return (
+            self.axial.multiple_1.jazz1_right_integrated_amplitude
+        )
 
-    @property
+    @derived("a_jazz_right", "a_jazz_left")
     def a_jazz_difference(self):
-        try:
-            return (
-                self.a_jazz_right
-                - self.a_jazz_left
-            )
-        except:
-            return np.nan
+        return (
+            self.a_jazz_right
+            - self.a_jazz_left
+        )
 
-    @property
+    @derived("a_jazz_difference", "axial.primary.integrated_absolute_amplitude")
     def a_phase_indicator(self):
-        try:
-            return (
-                self.a_jazz_difference
-                / self.axial.primary.integrated_absolute_amplitude
-            )
-        except:
-            return np.nan
+        return (
+            self.a_jazz_difference
+            / self.axial.primary.integrated_absolute_amplitude
+        )
 
-    @property
+    @derived(
+        "a_jazz_difference",
+        "axial.multiple_1.integrated_absolute_amplitude",
+        "axial.primary.integrated_absolute_amplitude",
+    )
     def a_modulus_p(self):
-        try:
-            return (
-                self.a_jazz_difference
-                - self.axial.multiple_1.integrated_absolute_amplitude
-            ) / self.axial.primary.integrated_absolute_amplitude
-        except:
-            return np.nan
+        return (
+            self.a_jazz_difference
+            - self.axial.multiple_1.integrated_absolute_amplitude
+        ) / self.axial.primary.integrated_absolute_amplitude
 
-    @property
+    @derived("a_modulus_p")
     def c_modulus_p(self):
-        try:
-            x = (self.a_modulus_p - 0.4) / 3
-            return (
-                1105 * (x ** 4) + 2314 * (x ** 3) + 1778 * (x ** 2) + 732.4 * x + 135.6
-            )
-        except:
-            return np.nan
+        x = (self.a_modulus_p - 0.4) / 3
+        # Horner form of 1105x^4 + 2314x^3 + 1778x^2 + 732.4x + 135.6: float
+        # ** n is a generic pow in numpy.
+        return (((1105 * x + 2314) * x + 1778) * x + 732.4) * x + 135.6
 
-    @property
+    @derived("a_jazz_left", "a_jazz_right")
     def a_jazz_ratio(self):
-        try:
-            return (
-                self.a_jazz_left
-                / self.a_jazz_right
-            )
-        except:
-            return np.nan
+        return (
+            self.a_jazz_left
+            / self.a_jazz_right
+        )
 
-    @property
+    @derived("a_ratio_1")
     def a_modulus_r_1(self):
         return (1 - self.a_ratio_1) / (1 + self.a_ratio_1)
 
-    @property
+    @derived("a_ratio_2")
     def a_modulus_r_2(self):
         return (1 - self.a_ratio_2) / (1 + self.a_ratio_2)
 
-    @property
+    @derived("a_modulus_r_1")
     def a_reflection_coef(self):
         return self.a_modulus_r_1
 
-    @property
+    @derived("axial.primary.amplitude")
     def a_strength(self):
-        return np.sqrt(self.axial.primary.amplitude.astype(float))
+        return np.sqrt(self.axial.primary.amplitude.astype(self._float))
 
-    @property
+    @derived("a_delay_1")
     def a_modulus_v_1(self):
         return 1.0 / self.a_delay_1
 
-    @property
+    @derived("a_delay_2")
     def a_modulus_v_2(self):
         return 1.0 / self.a_delay_2
 
-    @property
+    @derived("tangential.multiple_1.time_pick", "tangential.primary.time_pick")
     def t_delay_1(self):
         return self.tangential.multiple_1.time_pick - self.tangential.primary.time_pick
 
-    @property
+    @derived("tangential.multiple_2.time_pick", "tangential.multiple_1.time_pick")
     def t_delay_2(self):
         return (
             self.tangential.multiple_2.time_pick - self.tangential.multiple_1.time_pick
         )
 
-    @property
+    @derived("t_modulus_r_1", "t_modulus_v_1")
     def t_density(self):
         return self.t_modulus_r_1 / (self.t_modulus_v_1 ** 2)
 
-    @property
+    @derived("tangential.primary.amplitude", "tangential.multiple_1.amplitude")
     def t_ratio(self):
         return self.tangential.primary.amplitude / self.tangential.multiple_1.amplitude
 
-    @property
+    @derived("t_ratio")
     def t_ratio_1(self):
         return self.t_ratio
 
-    @property
+    @derived("tangential.multiple_1.amplitude", "tangential.multiple_2.amplitude")
     def t_ratio_2(self):
         return (
             self.tangential.multiple_1.amplitude / self.tangential.multiple_2.amplitude
         )
 
-    @property
+    @derived("t_ratio")
     def t_modulus_r_1(self):
         return (1 - self.t_ratio) / (1 + self.t_ratio)
 
-    @property
+    @derived("t_ratio_2")
     def t_modulus_r_2(self):
         return (1 - self.t_ratio_2) / (1 + self.t_ratio_2)
 
-    @property
+    @derived("t_modulus_r_1")
     def t_reflection_coef(self):
         return self.t_modulus_r_1
 
-    @property
+    @derived("tangential.primary.amplitude")
     def t_strength(self):
-        return np.sqrt(self.tangential.primary.amplitude.astype(float))
+        return np.sqrt(self.tangential.primary.amplitude.astype(self._float))
 
-    @property
+    @derived("t_delay_1")
     def t_modulus_v_1(self):
         return 1.0 / self.t_delay_1
 
-    @property
+    @derived("t_delay_2")
     def t_modulus_v_2(self):
         return 1.0 / self.t_delay_2
 
-    @property
+    @derived("tangential.multiple_1.jazz1_left_integrated_amplitude")
     def t_jazz_left(self):
-        try:
-            return (
-                self.tangential.multiple_1.jazz1_left_integrated_amplitude
-            )
-        except:
-            return np.nan
+        return (
+            self.tangential.multiple_1.jazz1_left_integrated_amplitude
+        )
 
-    @property
+    @derived("tangential.multiple_1.jazz1_right_integrated_amplitude")
     def t_jazz_right(self):
-        try:
-            return (
-                self.tangential.multiple_1.jazz1_right_integrated_amplitude
-            )
-        except:
-            return np.nan
+        return (
+            self.tangential.multiple_1.jazz1_right_integrated_amplitude
+        )
 
-    @property
+    @derived(
+        "tangential.multiple_1.jazz1_right_integrated_amplitude",
+        "tangential.multiple_1.jazz1_left_integrated_amplitude",
+    )
     def t_jazz_difference(self):
-        try:
-            return (
-                self.tangential.multiple_1.jazz1_right_integrated_amplitude
-                - self.tangential.multiple_1.jazz1_left_integrated_amplitude
-            )
-        except:
-            return np.nan
+        return (
+            self.tangential.multiple_1.jazz1_right_integrated_amplitude
+            - self.tangential.multiple_1.jazz1_left_integrated_amplitude
+        )
 
-    @property
+    @derived("t_jazz_difference", "tangential.primary.integrated_absolute_amplitude")
     def t_phase_indicator(self):
-        try:
-            return (
-                self.t_jazz_difference
-                / self.tangential.primary.integrated_absolute_amplitude
-            )
-        except:
-            return np.nan
+        return (
+            self.t_jazz_difference
+            / self.tangential.primary.integrated_absolute_amplitude
+        )
 
-    @property
+    @derived(
+        "tangential.multiple_1.jazz1_left_integrated_amplitude",
+        "tangential.multiple_1.jazz1_right_integrated_amplitude",
+    )
     def t_jazz_ratio(self):
-        try:
-            return (
-                self.tangential.multiple_1.jazz1_left_integrated_amplitude
-                / self.tangential.multiple_1.jazz1_right_integrated_amplitude
-            )
-        except:
-            return np.nan
+        return (
+            self.tangential.multiple_1.jazz1_left_integrated_amplitude
+            / self.tangential.multiple_1.jazz1_right_integrated_amplitude
+        )
 
-    @property
+    @derived(
+        "t_jazz_difference",
+        "tangential.multiple_1.integrated_absolute_amplitude",
+        "tangential.primary.integrated_absolute_amplitude",
+    )
     def t_modulus_p(self):
-        try:
-            return (
-                self.t_jazz_difference
-                - self.tangential.multiple_1.integrated_absolute_amplitude
-            ) / self.tangential.primary.integrated_absolute_amplitude
-        except:
-            return np.nan
-
-    def _populate(self):
-        """
-        Populates dataframe with all the physical properties defined in this
-        class.
-        """
-        skip = (
-            dir(type("dummy", (object,), {}))
-            + [
-                "_is_rhino",
-                "dataframe",
-                "_populate",
-                "config",
-                "recipes",
-                "_drop_features",
-                "current_recipe",
-            ]
-            + RECIPES
-            + COMPONENTS
-        )
+        return (
+            self.t_jazz_difference
+            - self.tangential.multiple_1.integrated_absolute_amplitude
+        ) / self.tangential.primary.integrated_absolute_amplitude
 
-        attrs = (
-            item
-            for item in dir(RhinoPhysics)
-            if (item not in skip)
-            and (("__" not in item))
-            and (not item.startswith("_"))
-            # and (not np.isnan(getattr(self, item)))
-            # and (not getattr(self, item) is None)
-            and (
-                (not item.startswith("a_"))
-                if "axial" not in self.components_to_process
-                else True
-            )
-            and (
-                (not item.startswith("t_"))
-                if "tangential" not in self.components_to_process
-                else True
-            )
-            and (
-                (not item.startswith("r_"))
-                if "radial" not in self.components_to_process
-                else True
-            )
-        )
+    def compute_block(self, outputs=None):
+        """
+        Computed outputs as one (outputs x rows) float array, with their names.
+        """
+        derived = self.compute(outputs)
+        block = np.empty((len(derived), len(self)), dtype=self._float)
+        for row, value in zip(block, derived.values()):
+            row[:] = value
+        return list(derived), block
+
+    def _populate(self, outputs=None):
+        """
+        Populates dataframe with the physical properties defined in this
+        class, or only with the given outputs.
+        """
+        if self.backend == "numpy":
+            self._populate_block(outputs)
+            self._is_populated = True
+            return
 
-        for col in attrs:
+        for col, value in self.compute(outputs).items():
             logger.debug("Adding {} to dataframe.".format(col))
             try:
-                self.dataframe[col] = getattr(self, col)
+                self.dataframe[col] = self._output_column(value)
             except Exception as e:
                 logger.debug("Failed to add {} to dataframe, ERROR: {}".format(col, e))
 
         self._is_populated = True
 
+    def _populate_block(self, outputs=None):
+        # The computed arrays are written as they are: a compute_block would
+        # copy every output once more before the dataframe copies it again.
+        derived = self.compute(outputs)
+        if not derived:
+            return
+        if isinstance(self.dataframe, dict):
+            self.dataframe.update(derived)
+        elif isinstance(self.dataframe, np.ndarray):
+            from numpy.lib import recfunctions
+
+            self.dataframe = recfunctions.append_fields(
+                self.dataframe, list(derived), list(derived.values()), usemask=False
+            )
+        else:
+            for name, value in derived.items():
+                self.dataframe[name] = self._output_column(value)
+
+    def _output_column(self, value):
+        """
+        Value as written to a dataframe: the float dtype, or the pandas
+        nullable one (NaN stored as <NA>) for "Float32"/"Float64".
+        """
+        if not self._nullable:
+            return value
+        import pandas as pd
+
+        return pd.array(np.asarray(value), dtype=self.dtype)
+
+    def dtype_report(self, outputs=None):
+        """
+        Memory of the outputs in dtype against float64 and the largest
+        relative difference of their values (over the finite, non zero
+        float64 values).
+        """
+        import pandas as pd
+
+        reference = type(self)(
+            self.dataframe,
+            use_recipe=self.current_recipe,
+            components_to_process=self.components_to_process,
+            column_index=self.column_index,
+            backend=self.backend,
+            kernel=self.kernel,
+            dtype=np.float64,
+        ).compute(outputs)
+        compact = self.compute(outputs)
+
+        rows = []
+        for name, expected in reference.items():
+            expected = np.asarray(expected)
+            value = np.asarray(compact[name], dtype=np.float64)
+            valid = np.isfinite(expected) & (expected != 0)
+            error = np.abs(value[valid] - expected[valid]) / np.abs(expected[valid])
+            rows.append(
+                dict(
+                    property=name,
+                    float64_bytes=expected.nbytes,
+                    bytes=np.asarray(compact[name]).nbytes,
+                    max_relative_error=error.max() if error.size else 0.0,
+                )
+            )
+        report = pd.DataFrame(
+            rows, columns=["property", "float64_bytes", "bytes", "max_relative_error"]
+        ).set_index("property")
+        report["saved_bytes"] = report["float64_bytes"] - report["bytes"]
+        return report
+
     def _drop_features(self):
         """
         Drop extracted features. For now, it looks for matches of J0 and J1
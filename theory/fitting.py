@@ -0,0 +1,362 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import curve_fit
+
+from .function_handler import ModelingFunction, equation_names
+
+logger = logging.getLogger(__name__)
+
+CRITERIA = ["aic", "bic", "rss"]
+
+# Columns of the fit_groups statistics, named apart from the parameters.
+GROUP_STATISTICS = ["_rows", "_rss", "_rmse", "_starts"]
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+def as_models(equations):
+    """
+    ModelingFunctions of equations: a dict of name -> equation string or
+    ModelingFunction, or an iterable of them.
+    """
+    if isinstance(equations, dict):
+        items = equations.items()
+    else:
+        items = [
+            (getattr(equation, "name", "equation_{}".format(i)), equation)
+            for i, equation in enumerate(equations)
+        ]
+    models = []
+    for name, equation in items:
+        if not isinstance(equation, ModelingFunction):
+            equation = ModelingFunction(equation, name=name)
+        models.append((name, equation))
+    return models
+
+
+def fitted_arguments(model):
+    """
+    Arguments curve_fit fits for model (all but the first).
+    """
+    return (model.variables + model.constants)[1:]
+
+
+def number_of_parameters(model):
+    """
+    Parameters of model counted by the information criteria: the
+    fitted_arguments the equation reads (models saved by older versions may
+    take names it does not).
+    """
+    names = equation_names(model.equation)
+    return len([name for name in fitted_arguments(model) if name in names])
+
+
+def random_starts(parameters, starts, seed=None, low=-2, high=2):
+    """
+    (starts, parameters) initial guesses: curve_fit's default of ones first,
+    then values with a random sign and a magnitude log-uniform between
+    10**low and 10**high.
+    """
+    rng = np.random.default_rng(seed)
+    guesses = np.ones((starts, parameters))
+    if starts > 1:
+        shape = (starts - 1, parameters)
+        guesses[1:] = rng.choice([-1.0, 1.0], shape) * 10 ** rng.uniform(low, high, shape)
+    return guesses
+
+
+def _multistart(name, model, X, y, starts, time_budget=None, patience=None, tolerance=1e-6,
+                use_jacobian=False, maxfev=1000000):
+    """
+    Fits model to X, y from each of starts and keeps the best fit.
+    """
+    function = model.as_function
+    jacobian = model.jacobian if use_jacobian else None
+    began = time.perf_counter()
+    deadline = None if time_budget is None else began + time_budget
+
+    def budgeted(f):
+        if f is None or deadline is None:
+            return f
+
+        def wrapper(*args):
+            if time.perf_counter() > deadline:
+                raise _BudgetExceeded()
+            return f(*args)
+
+        return wrapper
+
+    best_rss, optimals = np.inf, None
+    tried = failed = stale = 0
+    stop = "starts"
+    for p0 in starts:
+        tried += 1
+        try:
+            fitted, _ = curve_fit(budgeted(function), X, y, p0=p0,
+                                  jac=budgeted(jacobian), maxfev=maxfev)
+        except _BudgetExceeded:
+            stop = "time_budget"
+            break
+        except (RuntimeError, ValueError, TypeError, ZeroDivisionError, OverflowError,
+                FloatingPointError, np.linalg.LinAlgError) as e:
+            logger.debug("{} failed from {}, ERROR: {}".format(name, p0, e))
+            failed += 1
+            continue
+
+        with np.errstate(all="ignore"):
+            rss = float(np.sum((function(X, *fitted) - y) ** 2))
+        if not np.isfinite(rss):
+            failed += 1
+            continue
+        if rss < best_rss * (1 - tolerance):
+            stale = 0
+        else:
+            stale += 1
+        if rss < best_rss:
+            best_rss, optimals = rss, fitted
+        if patience is not None and stale >= patience:
+            stop = "patience"
+            break
+        if deadline is not None and time.perf_counter() > deadline:
+            stop = "time_budget"
+            break
+
+    return dict(name=name, model=model, optimals=optimals, rss=best_rss, starts=tried,
+                failed=failed, stop=stop, seconds=time.perf_counter() - began)
+
+
+def _fit_task(task):
+    """
+    Worker side of fit_models: the starts of one model.
+    """
+    return _multistart(*task)
+
+
+def fit_models(
+    equations,
+    X,
+    y,
+    starts=8,
+    processes=None,
+    rank_by="aic",
+    time_budget=None,
+    patience=None,
+    tolerance=1e-6,
+    use_jacobian=False,
+    maxfev=1000000,
+    seed=None,
+):
+    """
+    Fits every candidate equation from several starting points in a process
+    pool and ranks the fits.
+
+    Each model is fitted from curve_fit's default guess and then from
+    starts - 1 random ones (see random_starts), keeping the fit with the
+    smallest residual. A model stops early after patience starts in a row
+    that do not improve its best residual by more than tolerance (relative),
+    or once it has used time_budget seconds, the running curve_fit included.
+
+    Args:
+        equations: dict of name -> equation string or ModelingFunction, or an
+            iterable of ModelingFunctions.
+        X, y (array): Data to fit.
+        starts (int): Starting points per model.
+        processes (int): Pool size (os.cpu_count() by default, 1 runs in
+            process).
+        rank_by (str): One of CRITERIA, smaller is better.
+        time_budget (float): Seconds per model.
+        patience (int): Starts without improvement before stopping a model.
+        tolerance (float): Relative residual improvement that resets patience.
+        use_jacobian (bool): Use the analytic jacobian when available (it
+            costs more to derive than most fits gain from it).
+        maxfev (int): Function evaluations per curve_fit.
+        seed (int): Seed of the random starts.
+
+    Returns:
+        pd.DataFrame: One row per model indexed by name and sorted by rank_by,
+        with the residual sum of squares, rmse, aic, bic, the number of
+        parameters and starts, why the starts stopped, the seconds spent and
+        the fitted ModelingFunction (None when no start converged).
+    """
+    if rank_by not in CRITERIA:
+        raise ValueError("rank_by must be one of {}, got {}".format(CRITERIA, rank_by))
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    models = as_models(equations)
+    seeds = np.random.SeedSequence(seed).spawn(len(models))
+    tasks = [
+        (name, model, X, y,
+         random_starts(len(fitted_arguments(model)), starts, seeds[i]),
+         time_budget, patience, tolerance, use_jacobian, maxfev)
+        for i, (name, model) in enumerate(models)
+    ]
+
+    processes = min(processes or os.cpu_count() or 1, len(tasks)) or 1
+    if processes == 1:
+        fits = [_fit_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            fits = list(pool.map(_fit_task, tasks))
+
+    return rank_fits(fits, len(y), rank_by)
+
+
+def rank_fits(fits, n, rank_by="aic"):
+    """
+    Table of the _fit_task results with the information criteria of n
+    observations, sorted by rank_by. The fitted models are copies, the
+    models of fits are left untouched.
+    """
+    rows = []
+    for fit in fits:
+        model = fit["model"]
+        k = number_of_parameters(model)
+        rss = fit["rss"]
+        converged = fit["optimals"] is not None
+        if converged:
+            model = ModelingFunction.from_dict(model.to_dict())
+            model.optimals = fit["optimals"]
+            model._fitted = True
+            with np.errstate(divide="ignore"):
+                likelihood = n * np.log(rss / n)
+        else:
+            likelihood = np.inf
+        rows.append(dict(
+            name=fit["name"],
+            equation=model.equation,
+            parameters=k,
+            rss=rss,
+            rmse=np.sqrt(rss / n),
+            aic=likelihood + 2 * k,
+            bic=likelihood + k * np.log(n),
+            starts=fit["starts"],
+            failed=fit["failed"],
+            stop=fit["stop"],
+            seconds=fit["seconds"],
+            model=model if converged else None,
+        ))
+    table = pd.DataFrame(rows).set_index("name")
+    return table.sort_values(rank_by, kind="stable")
+
+
+def best_model(table):
+    """
+    Fitted ModelingFunction of the top ranked row of a fit_models table.
+    """
+    fitted = table["model"].dropna()
+    if fitted.empty:
+        raise ValueError("No model converged")
+    return fitted.iloc[0]
+
+
+def _fit_groups_task(task):
+    """
+    Worker side of fit_groups: fits the model to each group of the task.
+    """
+    model, groups, starts, kwargs = task
+    fits = []
+    for key, X, y in groups:
+        fit = _multistart(key, model, X, y, starts, **kwargs)
+        fits.append((key, len(y), fit["optimals"], fit["rss"], fit["starts"]))
+    return fits
+
+
+def fit_groups(
+    dataframe,
+    equation,
+    x,
+    y,
+    by,
+    starts=1,
+    p0=None,
+    processes=None,
+    tasks_per_process=4,
+    seed=None,
+    **kwargs
+):
+    """
+    Fits one equation per group of a long dataframe (e.g. one delay to
+    modulus curve per mine, pipe and component) in a process pool.
+
+    Groups are dealt to about processes * tasks_per_process tasks, so each
+    worker compiles the equation (and its jacobian) once for many groups.
+    Every group is fitted from the same starting points: p0 (ones by
+    default) and starts - 1 random ones.
+
+    Args:
+        dataframe (pd.DataFrame): Long table with the data of every group.
+        equation: Equation string or ModelingFunction.
+        x, y (str): Columns of the independent and dependent variables.
+        by (str or list): Group key columns.
+        starts (int): Starting points per group.
+        p0 (array): First starting point.
+        processes (int): Pool size (os.cpu_count() by default, 1 runs in
+            process).
+        tasks_per_process (int): Tasks queued per process, for load balance.
+        seed (int): Seed of the random starts.
+        kwargs: time_budget, patience, tolerance, use_jacobian and maxfev
+            of each group fit, see fit_models.
+
+    Returns:
+        pd.DataFrame: One row per group indexed by the group keys, with the
+        fitted parameters (NaN when no start converged) and the
+        GROUP_STATISTICS: the number of rows, the residual sum of squares,
+        rmse and the starts tried.
+    """
+    if not isinstance(equation, ModelingFunction):
+        equation = ModelingFunction(equation)
+    arguments = fitted_arguments(equation)
+    names = equation_names(equation.equation)
+    parameters = [name for name in arguments if name in names]
+    colliding = [p for p in parameters if p in GROUP_STATISTICS]
+    if colliding:
+        raise ValueError("Parameters {} collide with the columns {}".format(colliding, GROUP_STATISTICS))
+    guesses = random_starts(len(arguments), starts, seed)
+    if p0 is not None:
+        guesses[0] = p0
+
+    keys = [by] if isinstance(by, str) else list(by)
+    X = dataframe[x].to_numpy(dtype=float)
+    Y = dataframe[y].to_numpy(dtype=float)
+    valid = np.isfinite(X) & np.isfinite(Y)
+    groups = []
+    for key, rows in dataframe.groupby(keys, sort=True).indices.items():
+        rows = rows[valid[rows]]
+        groups.append((key, X[rows], Y[rows]))
+
+    processes = processes or os.cpu_count() or 1
+    # Largest groups first, dealt round robin to balance the tasks.
+    groups.sort(key=lambda group: -len(group[1]))
+    number_of_tasks = max(min(processes * tasks_per_process, len(groups)), 1)
+    tasks = [(equation, groups[i::number_of_tasks], guesses, kwargs)
+             for i in range(number_of_tasks)]
+    if processes == 1:
+        results = [_fit_groups_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_fit_groups_task, tasks))
+
+    rows = []
+    for key, n, optimals, rss, tried in (fit for task in results for fit in task):
+        if optimals is None:
+            optimals = np.full(len(arguments), np.nan)
+            rss = np.nan
+        row = dict((name, value) for name, value in zip(arguments, optimals) if name in names)
+        row.update(zip(GROUP_STATISTICS, (n, rss, np.sqrt(rss / n) if n else np.nan, tried)))
+        rows.append((key, row))
+
+    if not rows:
+        return pd.DataFrame(columns=keys + parameters + GROUP_STATISTICS).set_index(keys)
+    index = [key for key, _ in rows]
+    if len(keys) > 1:
+        index = pd.MultiIndex.from_tuples(index, names=keys)
+    else:
+        index = pd.Index([k[0] if isinstance(k, tuple) else k for k in index], name=keys[0])
+    return pd.DataFrame([row for _, row in rows], index=index).sort_index()
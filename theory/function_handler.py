@@ -1,9 +1,146 @@
 from scipy.optimize import curve_fit
 from boltons.funcutils import FunctionBuilder
 from functools import partial
+import ast
+import json
+import keyword
+import logging
+import os
 import pickle
+import warnings
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+# np attributes an equation may use: functions it may call and constants.
+NUMPY_FUNCTIONS = ('exp', 'log', 'log10', 'sqrt', 'power', 'abs', 'sin', 'cos',
+                   'tan', 'arctan', 'tanh', 'asarray')
+NUMPY_CONSTANTS = ('pi', 'e')
+
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.UAdd, ast.USub,
+              ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+# Lambdified derivatives by (equation, arguments), shared by the models of a
+# process: deriving them with sympy costs more than most fits.
+_DERIVATIVES = {}
+
+
+def _sympy_numpy():
+    """
+    Namespace mapping the np.* calls of the equations to sympy.
+    """
+    import sympy
+    from types import SimpleNamespace
+
+    return SimpleNamespace(
+        exp=sympy.exp,
+        log=sympy.log,
+        log10=lambda x: sympy.log(x, 10),
+        sqrt=sympy.sqrt,
+        power=sympy.Pow,
+        abs=sympy.Abs,
+        sin=sympy.sin,
+        cos=sympy.cos,
+        tan=sympy.tan,
+        arctan=sympy.atan,
+        tanh=sympy.tanh,
+        asarray=lambda x: x,
+        pi=sympy.pi,
+        e=sympy.E,
+    )
+
+
+def _is_name(name):
+    return isinstance(name, str) and name.isidentifier() and not keyword.iskeyword(name)
+
+
+def equation_names(equation):
+    """
+    Names an equation reads, np left out (e.g. ['a', 'b', 'x', 'c'] for
+    'a * np.exp(-b * x) + c'), in order of appearance.
+    """
+    nodes = sorted(
+        (node for node in ast.walk(ast.parse(equation, mode='eval'))
+         if isinstance(node, ast.Name) and node.id != 'np'),
+        key=lambda node: node.col_offset)
+    names = []
+    for node in nodes:
+        if node.id not in names:
+            names.append(node.id)
+    return names
+
+
+def check_equation(equation, arguments):
+    """
+    Raises ValueError unless equation is arithmetic and comparisons of
+    numbers, of the arguments and of np.NUMPY_FUNCTIONS calls (and
+    NUMPY_CONSTANTS), and every argument is a plain identifier. Equations
+    are compiled, so this runs before any of them is.
+    """
+    for name in arguments:
+        if not _is_name(name) or name == 'np':
+            raise ValueError("Invalid argument name {!r}".format(name))
+    try:
+        tree = ast.parse(equation, mode='eval')
+    except (SyntaxError, TypeError, ValueError) as e:
+        raise ValueError("Invalid equation {!r}: {}".format(equation, e))
+
+    def numpy_attribute(node, allowed):
+        return (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name)
+                and node.value.id == 'np' and node.attr in allowed)
+
+    def check(node):
+        if isinstance(node, ast.Expression):
+            check(node.body)
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, _OPERATORS):
+            check(node.left)
+            check(node.right)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, _OPERATORS):
+            check(node.operand)
+        elif isinstance(node, ast.Compare) and all(isinstance(op, _OPERATORS) for op in node.ops):
+            check(node.left)
+            for comparator in node.comparators:
+                check(comparator)
+        elif isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            pass
+        elif isinstance(node, ast.Name) and node.id in arguments:
+            pass
+        elif numpy_attribute(node, NUMPY_CONSTANTS):
+            pass
+        elif (isinstance(node, ast.Call) and numpy_attribute(node.func, NUMPY_FUNCTIONS)
+              and not node.keywords):
+            for argument in node.args:
+                check(argument)
+        else:
+            raise ValueError("Equation {!r} may not contain {}".format(
+                equation, ast.dump(node)[:80]))
+
+    check(tree)
+
+
+def _derivatives(equation, arguments):
+    """
+    Lambdified partial derivatives of equation with respect to arguments[1:],
+    or None when sympy is not installed or cannot parse the equation.
+    """
+    try:
+        import sympy
+    except ImportError:
+        return None
+
+    check_equation(equation, arguments)
+    symbols = dict((name, sympy.Symbol(name)) for name in arguments)
+    try:
+        expression = sympy.sympify(equation, locals=dict(symbols, np=_sympy_numpy()))
+        return sympy.lambdify(
+            [symbols[name] for name in arguments],
+            [sympy.diff(expression, symbols[name]) for name in arguments[1:]],
+            modules='numpy', cse=True)
+    except Exception as e:
+        logger.debug("No analytic jacobian for {}, ERROR: {}".format(equation, e))
+        return None
+
+
 class ModelingFunction:
     def __init__(self, equation,
                  variables=['x', 'y', 'z'],
@@ -12,8 +149,15 @@ class ModelingFunction:
                 ):
         self.equation = equation
         self.name = name
-        self.constants = [c for c in constants if c in equation]
-        self.variables = [c for c in variables if c in equation]
+        # The names the equation reads, not its substrings: the 'e', 'n'
+        # and 'p' of np.exp are no constants.
+        try:
+            names = equation_names(equation)
+        except SyntaxError:
+            # check_equation reports it when compiling.
+            names = []
+        self.constants = [c for c in constants if c in names]
+        self.variables = [c for c in variables if c in names]
         self._fitted = False
 
     def __call__(self, X, *args):
@@ -23,12 +167,64 @@ class ModelingFunction:
         else:
             return self.as_function(X, *args)
 
+    def __getstate__(self):
+        # The compiled callables are rebuilt on demand.
+        state = self.__dict__.copy()
+        state.pop('_function', None)
+        state.pop('_jacobian', None)
+        return state
+
     @property
     def as_function(self):
-        fb = FunctionBuilder(name=self.name,
-                             body='import numpy as np\nreturn ' + self.equation,
-                             args=self.variables + self.constants)
-        return fb.get_func()
+        """
+        The equation as a function of the variables and constants, compiled
+        on first use (after check_equation).
+        """
+        function = self.__dict__.get('_function')
+        if function is None:
+            check_equation(self.equation, self.variables + self.constants)
+            # name is free text (e.g. a registry key), the function needs an
+            # identifier.
+            name = str(self.name)
+            if not _is_name(name):
+                name = 'equation'
+            fb = FunctionBuilder(name=name,
+                                 body='return ' + self.equation,
+                                 args=self.variables + self.constants)
+            function = self._function = fb.get_func(execdict={'np': np})
+        return function
+
+    @property
+    def jacobian(self):
+        """
+        Analytic Jacobian of the equation with respect to the arguments fitted
+        by curve_fit (all but the first), as a function of (X, *args)
+        returning a (len(X), len(args)) array. Derived with sympy on first
+        use (once per equation in a process); None when sympy is not
+        installed or cannot parse the equation.
+        """
+        if '_jacobian' not in self.__dict__:
+            self._jacobian = self._make_jacobian()
+        return self._jacobian
+
+    def _make_jacobian(self):
+        arguments = self.variables + self.constants
+        key = (self.equation, tuple(arguments))
+        if key not in _DERIVATIVES:
+            _DERIVATIVES[key] = _derivatives(self.equation, arguments)
+        derivatives = _DERIVATIVES[key]
+        if derivatives is None:
+            return None
+
+        def jacobian(X, *args):
+            X = np.asarray(X, dtype=float)
+            columns = derivatives(X, *args)
+            out = np.empty((len(columns),) + X.shape)
+            for row, column in zip(out, columns):
+                row[...] = column
+            return out.T
+
+        return jacobian
 
     @property
     def as_partial(self):
@@ -37,9 +233,15 @@ class ModelingFunction:
         else:
             return self.as_function
 
-    def fit(self, X, y):
+    def fit(self, X, y, p0=None, use_jacobian=False):
+        """
+        Fits the constants with curve_fit, with finite differences or with
+        the analytic jacobian when use_jacobian is set and it is available.
+        """
+        jacobian = self.jacobian if use_jacobian else None
         self._fitted = True
-        self.optimals, _ = curve_fit(self.as_function, X, y, maxfev=1000000)
+        self.optimals, _ = curve_fit(self.as_function, X, y, p0=p0,
+                                     jac=jacobian, maxfev=1000000)
 
     def predict(self, X):
         X = np.asarray(X)
@@ -57,9 +259,133 @@ class ModelingFunction:
     def __repr__(self):
         return '<Equation: {} - Curve Fitted: {}>'.format(self.equation, self._fitted)
 
+    def to_dict(self):
+        """
+        The equation, names and fitted constants as plain python types.
+        """
+        return dict(
+            name=self.name,
+            equation=self.equation,
+            variables=list(self.variables),
+            constants=list(self.constants),
+            optimals=np.asarray(self.optimals, dtype=float).tolist() if self._fitted else None,
+        )
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        ModelingFunction of a to_dict, compiled once. Raises ValueError for a
+        record check_equation rejects, before compiling anything.
+        """
+        check_equation(d['equation'], list(d['variables']) + list(d['constants']))
+        function = cls(d['equation'], variables=d['variables'],
+                       constants=d['constants'], name=d.get('name', 'equation'))
+        # The names are stored, not guessed again from the equation.
+        function.variables = list(d['variables'])
+        function.constants = list(d['constants'])
+        if d.get('optimals') is not None:
+            function.optimals = np.asarray(d['optimals'], dtype=float)
+            function._fitted = True
+        function.as_function
+        return function
+
     def save(self, filename):
-        pickle.dump(self, open(filename, 'wb'))
+        """
+        Saves the model to a .json or .npz file (see save_models). Pickle
+        (.pkl, .pickle, .model) and extensionless filenames, which older
+        versions pickled to, are saved as .json next to them with a
+        FutureWarning.
+        """
+        path = _model_filename(filename)
+        if path != filename:
+            warnings.warn(
+                "Models are no longer pickled, saving {} as {}".format(filename, path),
+                FutureWarning, stacklevel=2)
+        save_models({self.name: self}, path)
 
     @classmethod
-    def load(self, filename):
-        return pickle.load(open(filename, 'rb'))
+    def load(cls, filename):
+        """
+        Loads a model saved with save, from the same filename. Files of
+        older versions (pickles) are still unpickled when no .json was saved
+        in their place, only load those from trusted sources.
+        """
+        path = _model_filename(filename)
+        if path != filename and not os.path.exists(path) and os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                return pickle.load(f)
+        models = load_models(path)
+        if len(models) != 1:
+            raise ValueError("{} holds {} models, use load_models".format(path, len(models)))
+        return next(iter(models.values()))
+
+
+PICKLE_EXTENSIONS = ('.pkl', '.pickle', '.model')
+
+
+def _extension(filename):
+    return os.path.splitext(str(filename))[1].lower()
+
+
+def _model_filename(filename):
+    """
+    filename, or its .json counterpart for the pickle and extensionless
+    filenames of older versions.
+    """
+    extension = _extension(filename)
+    if extension in PICKLE_EXTENSIONS or not extension:
+        return os.path.splitext(str(filename))[0] + '.json'
+    return filename
+
+
+def save_models(models, filename):
+    """
+    Saves a registry of models (dict of key -> ModelingFunction) to one
+    file: .json holds a list of ModelingFunction.to_dict with their registry
+    key, .npz the same list as a json string plus one float array of
+    optimals per fitted model.
+    """
+    records = []
+    for key, model in models.items():
+        record = model.to_dict()
+        record['key'] = key
+        records.append(record)
+
+    extension = _extension(filename)
+    if extension == '.json':
+        with open(filename, 'w') as f:
+            json.dump(dict(models=records), f, indent=2)
+    elif extension == '.npz':
+        arrays = {}
+        for i, record in enumerate(records):
+            if record['optimals'] is not None:
+                arrays['optimals_{}'.format(i)] = np.asarray(record.pop('optimals'))
+                record['optimals'] = 'optimals_{}'.format(i)
+        with open(filename, 'wb') as f:
+            np.savez(f, models=np.array(json.dumps(records)), **arrays)
+    else:
+        raise ValueError("Unsupported model file {}, use .json or .npz".format(filename))
+
+
+def load_models(filename):
+    """
+    Loads the registry of models of a save_models file, compiling each
+    equation once. Returns a dict of key -> ModelingFunction.
+    """
+    extension = _extension(filename)
+    if extension == '.json':
+        with open(filename) as f:
+            records = json.load(f)['models']
+    elif extension == '.npz':
+        with np.load(filename, allow_pickle=False) as npz:
+            records = json.loads(str(npz['models']))
+            for record in records:
+                if record.get('optimals') is not None:
+                    record['optimals'] = npz[record['optimals']]
+    else:
+        raise ValueError("Unsupported model file {}, use .json or .npz".format(filename))
+    # Files saved before the keys were stored apart hold them as names.
+    return dict(
+        (record.get('key', record['name']), ModelingFunction.from_dict(record))
+        for record in records
+    )
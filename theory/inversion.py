@@ -0,0 +1,243 @@
+import logging
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .core import BatchedTheoreticalWavelet
+from .kernels import FORMULAS, evaluate
+
+logger = logging.getLogger(__name__)
+
+VELOCITY_COLUMNS = {"axial": "alpha", "tangential": "beta"}
+
+ROCK_COLUMNS = ["alpha", "beta", "rho", "modulus"]
+
+# Windows in seconds relative to the multiple pick (dcrhino_lib's
+# additional_pick_based_amplitude_windows).
+JAZZ_WINDOWS = {"left": (-0.006, -0.002), "right": (0.002, 0.006)}
+
+# Half width in seconds of the integrated absolute amplitude around a pick.
+AMPLITUDE_HALF_WIDTH = 0.00105
+
+DEFAULT_FEATURES = ["delay_1", "reflection_coef", "jazz_ratio"]
+
+
+def _rows(array):
+    return np.arange(array.shape[0])
+
+
+def pick(wavelets, time):
+    """
+    Time and amplitude of the largest absolute value of each row of
+    wavelets, refined between samples with a parabola through the pick and
+    its neighbours.
+    """
+    index = np.clip(np.abs(wavelets).argmax(axis=-1), 1, wavelets.shape[-1] - 2)
+    rows = _rows(wavelets)
+    left, center, right = (wavelets[rows, index + shift] for shift in (-1, 0, 1))
+    curvature = left - 2 * center + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = np.where(curvature != 0, 0.5 * (left - right) / curvature, 0.0)
+    offset = np.clip(offset, -0.5, 0.5)
+    step = time[1] - time[0]
+    return (
+        time[index] + offset * step,
+        center - 0.25 * (left - right) * offset,
+    )
+
+
+def integrate(wavelets, time, start, stop, absolute=False):
+    """
+    Integral of each row of wavelets between its start and stop times
+    (arrays of one value per row), clipped to the time range.
+    """
+    step = time[1] - time[0]
+    values = np.abs(wavelets) if absolute else wavelets
+    cumulative = np.concatenate(
+        [np.zeros((values.shape[0], 1)), np.cumsum(values, axis=-1)], axis=-1
+    )
+    first = np.clip(np.searchsorted(time, start), 0, len(time))
+    last = np.clip(np.searchsorted(time, stop), 0, len(time))
+    rows = _rows(values)
+    return (cumulative[rows, last] - cumulative[rows, first]) * step
+
+
+def wavelet_features(primary, multiple, time, jazz_windows=JAZZ_WINDOWS,
+                     half_width=AMPLITUDE_HALF_WIDTH):
+    """
+    Features of (rock x time) primary and multiple wavelets named like the
+    kernels.FORMULA_INPUTS columns: picks, amplitudes, integrated absolute
+    amplitudes and the jazz integrals around the multiple pick.
+    """
+    features = OrderedDict()
+    for window, wavelets in (("primary", primary), ("multiple_1", multiple)):
+        time_pick, amplitude = pick(wavelets, time)
+        features["{}_time_pick".format(window)] = time_pick
+        features["{}_amplitude".format(window)] = amplitude
+        features["{}_integrated_absolute_amplitude".format(window)] = integrate(
+            wavelets, time, time_pick - half_width, time_pick + half_width, absolute=True)
+    time_pick = features["multiple_1_time_pick"]
+    for side, (start, stop) in sorted(jazz_windows.items()):
+        features["multiple_1_jazz1_{}_integrated_amplitude".format(side)] = integrate(
+            multiple, time, time_pick + start, time_pick + stop)
+    return features
+
+
+def forward_table(pipe, velocities, densities, component="axial", window=310,
+                  filtered=True, jazz_windows=JAZZ_WINDOWS, **kwargs):
+    """
+    Features of the theoretical wavelets of every (velocity, density) pair.
+
+    The rocks are modeled with BatchedTheoreticalWavelet on the coarsest
+    frequency grid that reproduces the window (see for_window). Besides the wavelet_features, the table holds every
+    derived property of kernels.FORMULAS they support (delay_1,
+    reflection_coef, jazz_ratio...). Times are in seconds from the center of
+    the window.
+
+    Args:
+        pipe (Pipe): Pipe shared by the rocks.
+        velocities, densities (array): Grid axes; alpha for axial, beta for
+            tangential.
+        component (str): 'axial' or 'tangential'.
+        window (int): Samples of the windowed wavelets.
+        filtered (bool): Extract the features from the band-passed wavelets.
+        jazz_windows (dict): left/right windows around the multiple pick.
+        kwargs: Passed to BatchedTheoreticalWavelet.
+
+    Returns:
+        pd.DataFrame: One row per rock with the velocity, rho, modulus (GPa)
+        and feature columns.
+    """
+    wavelet = BatchedTheoreticalWavelet.from_grid(
+        pipe, velocities, densities, component=component, **kwargs
+    ).for_window(window, filtered=filtered)
+    time = wavelet.get_time_range_for_window(window)[:window] / 1000
+
+    primary = wavelet.primary_in_time_domain(window, filtered=filtered)
+    multiple = wavelet.multiple_in_time_domain(window, filtered=filtered)
+    inputs = wavelet_features(primary, multiple, time, jazz_windows)
+    with np.errstate(all="ignore"):
+        derived = evaluate(FORMULAS, inputs, engine="numpy")
+
+    velocity = np.broadcast_to(wavelet._rock_velocity[:, 0], (len(wavelet),))
+    density = np.broadcast_to(wavelet._rock_density[:, 0], (len(wavelet),))
+    table = OrderedDict([
+        (VELOCITY_COLUMNS.get(component, "velocity"), velocity),
+        ("rho", density),
+        ("modulus", (density / 1000) * (velocity / 1000) ** 2),
+    ])
+    table.update(inputs)
+    table.update(derived)
+    return pd.DataFrame(table)
+
+
+class FeatureInversion(object):
+    """
+    Inverse of a forward_table: rock properties from measured features.
+
+    The feature columns of the table are standardized and stored in a k-d
+    tree. A query takes the k nearest table rows of each measurement and
+    interpolates the targets with inverse distance weights, for millions of
+    rows in one call. Measurements outside the range of the table (any
+    feature beyond its min/max, or further than max_distance standard
+    deviations from the nearest row) are flagged as out_of_range.
+
+    Args:
+        table (pd.DataFrame): Forward table, see forward_table.
+        features (list): Feature columns matched against the measurements.
+        targets (list): Columns to interpolate (the ROCK_COLUMNS of the table
+            by default).
+        k (int): Neighbours per query.
+        max_distance (float): Standardized distance beyond which the nearest
+            row is too far (no limit by default).
+
+    Usage:
+        inversion = FeatureInversion(forward_table(pipe, alphas, rhos), ['delay_1', 'reflection_coef'])
+        rocks = inversion.query(measured[['delay_1', 'reflection_coef']])
+    """
+
+    def __init__(self, table, features=DEFAULT_FEATURES, targets=None, k=4, max_distance=None):
+        from scipy.spatial import cKDTree
+
+        self.features = list(features)
+        missing = [f for f in self.features if f not in table.columns]
+        if missing:
+            raise ValueError("Features {} are not in the table".format(missing))
+        if targets is None:
+            targets = [c for c in ROCK_COLUMNS if c in table.columns]
+        self.targets = list(targets)
+        self.k = k
+        self.max_distance = max_distance
+
+        points = table[self.features].to_numpy(dtype=float)
+        valid = np.isfinite(points).all(axis=1)
+        if not valid.any():
+            raise ValueError("The table has no row with finite {}".format(self.features))
+        if not valid.all():
+            logger.debug("Dropped {} table rows with missing features.".format((~valid).sum()))
+        points = points[valid]
+        self.values = table[self.targets].to_numpy(dtype=float)[valid]
+        self.minimum = points.min(axis=0)
+        self.maximum = points.max(axis=0)
+        self.center = points.mean(axis=0)
+        self.scale = points.std(axis=0)
+        self.scale[self.scale == 0] = 1
+        self.tree = cKDTree((points - self.center) / self.scale)
+
+    def __len__(self):
+        return self.tree.n
+
+    def _as_points(self, measurements):
+        if isinstance(measurements, pd.DataFrame):
+            return measurements[self.features].to_numpy(dtype=float), measurements.index
+        points = np.asarray(measurements, dtype=float)
+        if points.ndim == 1:
+            points = points[:, np.newaxis]
+        return points, None
+
+    def query(self, measurements, workers=-1):
+        """
+        Interpolated targets of measurements (a dataframe with the feature
+        columns or an (n x features) array), plus the standardized distance
+        to the nearest table row and the out_of_range flag. Rows with a
+        missing feature get NaN targets.
+        """
+        points, index = self._as_points(measurements)
+        k = min(self.k, len(self))
+        valid = np.isfinite(points).all(axis=1)
+        values = np.full((len(points), len(self.targets)), np.nan)
+        nearest = np.full(len(points), np.nan)
+
+        if valid.any():
+            scaled = (points[valid] - self.center) / self.scale
+            distances, neighbours = self.tree.query(scaled, k=k, workers=workers)
+            if k == 1:
+                distances, neighbours = distances[:, np.newaxis], neighbours[:, np.newaxis]
+            weights = 1 / np.maximum(distances, 1e-12)
+            # Exact matches take the value of the matching row.
+            exact = distances[:, :1] <= 1e-12
+            weights = np.where(exact, np.arange(k) == 0, weights)
+            weights /= weights.sum(axis=1, keepdims=True)
+            values[valid] = np.einsum("nk,nkt->nt", weights, self.values[neighbours])
+            nearest[valid] = distances[:, 0]
+
+        with np.errstate(invalid="ignore"):
+            out_of_range = ~valid | ((points < self.minimum) | (points > self.maximum)).any(axis=1)
+            if self.max_distance is not None:
+                out_of_range |= nearest > self.max_distance
+
+        result = pd.DataFrame(values, columns=self.targets, index=index)
+        result["distance"] = nearest
+        result["out_of_range"] = out_of_range
+        return result
+
+    @classmethod
+    def from_model(cls, pipe, velocities, densities, features=DEFAULT_FEATURES,
+                   component="axial", targets=None, k=4, max_distance=None, **kwargs):
+        """
+        Inversion of a forward_table built from the wavelet model; kwargs
+        are passed to forward_table.
+        """
+        table = forward_table(pipe, velocities, densities, component=component, **kwargs)
+        return cls(table, features, targets=targets, k=k, max_distance=max_distance)
@@ -0,0 +1,202 @@
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+COMPONENT_PREFIXES = {"axial": "a", "tangential": "t", "radial": "r"}
+
+# Feature columns read by the formulas of one component: name -> (window, feature).
+FORMULA_INPUTS = OrderedDict(
+    [
+        ("primary_time_pick", ("primary", "time_pick")),
+        ("multiple_1_time_pick", ("multiple_1", "time_pick")),
+        ("multiple_2_time_pick", ("multiple_2", "time_pick")),
+        ("primary_amplitude", ("primary", "amplitude")),
+        ("multiple_1_amplitude", ("multiple_1", "amplitude")),
+        ("multiple_2_amplitude", ("multiple_2", "amplitude")),
+        (
+            "primary_integrated_absolute_amplitude",
+            ("primary", "integrated_absolute_amplitude"),
+        ),
+        (
+            "multiple_1_integrated_absolute_amplitude",
+            ("multiple_1", "integrated_absolute_amplitude"),
+        ),
+        (
+            "multiple_1_jazz1_left_integrated_amplitude",
+            ("multiple_1", "jazz1_left_integrated_amplitude"),
+        ),
+        (
+            "multiple_1_jazz1_right_integrated_amplitude",
+            ("multiple_1", "jazz1_right_integrated_amplitude"),
+        ),
+    ]
+)
+
+# Derived properties of one component (the RhinoPhysics a_*/t_* properties
+# without their prefix), dependencies first.
+FORMULAS = OrderedDict(
+    [
+        ("delay_1", "multiple_1_time_pick - primary_time_pick"),
+        ("delay_2", "multiple_2_time_pick - multiple_1_time_pick"),
+        ("ratio", "primary_amplitude / multiple_1_amplitude"),
+        ("ratio_1", "ratio"),
+        ("ratio_2", "multiple_1_amplitude / multiple_2_amplitude"),
+        ("modulus_r_1", "(1 - ratio_1) / (1 + ratio_1)"),
+        ("modulus_r_2", "(1 - ratio_2) / (1 + ratio_2)"),
+        ("reflection_coef", "modulus_r_1"),
+        ("modulus_v_1", "1.0 / delay_1"),
+        ("modulus_v_2", "1.0 / delay_2"),
+        ("density", "modulus_r_1 / (modulus_v_1 ** 2)"),
+        ("strength", "sqrt(primary_amplitude)"),
+        ("jazz_left", "multiple_1_jazz1_left_integrated_amplitude"),
+        ("jazz_right", "multiple_1_jazz1_right_integrated_amplitude"),
+        ("jazz_difference", "jazz_right - jazz_left"),
+        ("jazz_ratio", "jazz_left / jazz_right"),
+        ("phase_indicator", "jazz_difference / primary_integrated_absolute_amplitude"),
+        (
+            "modulus_p",
+            "(jazz_difference - multiple_1_integrated_absolute_amplitude)"
+            " / primary_integrated_absolute_amplitude",
+        ),
+    ]
+)
+
+# Calibrated properties computed from the axial formulas (kept unprefixed).
+AXIAL_FORMULAS = OrderedDict(
+    [
+        # Horner form of 1105x^4 + 2314x^3 + 1778x^2 + 732.4x + 135.6.
+        (
+            "c_modulus_p",
+            "(((1105 * ((modulus_p - 0.4) / 3) + 2314) * ((modulus_p - 0.4) / 3)"
+            " + 1778) * ((modulus_p - 0.4) / 3) + 732.4) * ((modulus_p - 0.4) / 3)"
+            " + 135.6",
+        ),
+    ]
+)
+
+FUNCTIONS = {"sqrt": np.sqrt}
+
+ENGINES = ["numexpr", "numpy"]
+
+_NAME = re.compile(r"\b[A-Za-z_]\w*\b")
+
+
+def _names(expression):
+    return [name for name in _NAME.findall(expression) if name not in FUNCTIONS]
+
+
+def numexpr_available():
+    try:
+        import numexpr  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def default_engine():
+    return "numexpr" if numexpr_available() else "numpy"
+
+
+def evaluation_plan(formulas, available, outputs=None):
+    """
+    Formulas needed for outputs (every formula by default) that can be
+    computed from the available names, dependencies first.
+    """
+    computable = set(available)
+    for name, expression in formulas.items():
+        if all(n in computable for n in _names(expression)):
+            computable.add(name)
+
+    if outputs is None:
+        outputs = list(formulas)
+    needed = set()
+    stack = [name for name in outputs if name in computable and name in formulas]
+    while stack:
+        name = stack.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        stack.extend(n for n in _names(formulas[name]) if n in formulas)
+    return [name for name in formulas if name in needed]
+
+
+def required_inputs(formulas, available, outputs=None):
+    """
+    Available names read by the evaluation_plan of outputs, so that only
+    those inputs need to be loaded.
+    """
+    read = set(
+        n for name in evaluation_plan(formulas, available, outputs)
+        for n in _names(formulas[name])
+    )
+    return [name for name in available if name in read]
+
+
+def inline(formulas, name, keep=()):
+    """
+    Expression of a formula with the formulas it reads substituted in, down
+    to the inputs or to the names in keep.
+    """
+
+    def substitute(match):
+        name = match.group(0)
+        if name in formulas and name not in keep:
+            return "({})".format(inline(formulas, name, keep))
+        return name
+
+    return _NAME.sub(substitute, formulas[name])
+
+
+def evaluate(formulas, inputs, outputs=None, engine=None, dtype=None):
+    """
+    Evaluates formulas over the arrays in inputs and returns the requested
+    outputs (all the formulas the inputs support by default) by name.
+
+    With numexpr every output is one fused expression of the inputs and of
+    the other outputs, evaluated in a single pass over the rows without full
+    length temporaries. The numpy engine evaluates the formulas in order and
+    reuses the intermediates. When dtype is given the outputs are stored with
+    it (numexpr writes straight into arrays of that dtype).
+    """
+    engine = engine or default_engine()
+    if engine not in ENGINES:
+        raise ValueError("engine must be one of {}, got {}".format(ENGINES, engine))
+    plan = evaluation_plan(formulas, inputs, outputs)
+    if outputs is None:
+        outputs = plan
+    outputs = [name for name in outputs if name in plan]
+
+    namespace = dict(inputs)
+    if engine == "numexpr":
+        import numexpr
+
+        keep = set(outputs)
+        for name in plan:
+            if name not in keep:
+                continue
+            expression = inline(formulas, name, keep)
+            if expression in namespace:
+                # Aliases (ratio_1, reflection_coef) share the array.
+                namespace[name] = namespace[expression]
+            elif dtype is None:
+                namespace[name] = numexpr.evaluate(expression, local_dict=namespace)
+            else:
+                # numexpr promotes float32 with float constants, cast on write.
+                shape = np.broadcast_shapes(
+                    *(np.shape(namespace[n]) for n in _names(expression))
+                )
+                namespace[name] = numexpr.evaluate(
+                    expression,
+                    local_dict=namespace,
+                    out=np.empty(shape, dtype=dtype),
+                    casting="unsafe",
+                )
+    else:
+        functions = dict(FUNCTIONS, __builtins__={})
+        for name in plan:
+            namespace[name] = eval(formulas[name], functions, namespace)
+    if dtype is not None:
+        for name in outputs:
+            namespace[name] = np.asarray(namespace[name]).astype(dtype, copy=False)
+    return OrderedDict((name, namespace[name]) for name in outputs)
@@ -0,0 +1,272 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from .feature_extraction import RhinoPhysics
+
+logger = logging.getLogger(__name__)
+
+
+def read_chunks(path, chunksize=100000, columns=None):
+    """
+    Yields a .csv or .parquet feature file as dataframes of at most chunksize
+    rows. Parquet files are read one record batch at a time (requires
+    pyarrow).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".parquet":
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif extension == ".csv":
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=columns):
+            yield chunk
+    else:
+        raise ValueError("Unsupported feature file {}".format(path))
+
+
+def populate_chunks(chunks, outputs=None, keep_columns=None, **kwargs):
+    """
+    Runs RhinoPhysics over each dataframe of chunks and yields the populated
+    chunks. When keep_columns is given only those input columns are kept next
+    to the derived ones. kwargs are passed to RhinoPhysics.
+    """
+    for chunk in chunks:
+        physics = RhinoPhysics(chunk, **kwargs)
+        derived = physics.compute(outputs)
+        if keep_columns is not None:
+            chunk = chunk[[c for c in keep_columns if c in chunk.columns]]
+        yield pd.concat([chunk, pd.DataFrame(derived, index=chunk.index)], axis=1)
+
+
+class _ChunkWriter(object):
+    """
+    Appends dataframes to a .csv or .parquet file. Every chunk is aligned to
+    the columns of the first one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.extension = os.path.splitext(path)[1].lower()
+        if self.extension not in (".csv", ".parquet"):
+            raise ValueError("Unsupported output file {}".format(path))
+        self.columns = None
+        self._parquet = None
+
+    def write(self, chunk):
+        first = self.columns is None
+        if first:
+            self.columns = list(chunk.columns)
+        else:
+            chunk = chunk.reindex(columns=self.columns)
+
+        if self.extension == ".csv":
+            chunk.to_csv(self.path, mode="w" if first else "a", header=first, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if first:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            else:
+                table = pa.Table.from_pandas(
+                    chunk, schema=self._parquet.schema, preserve_index=False
+                )
+            self._parquet.write_table(table)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def stream_rhino_physics(
+    source,
+    destination,
+    chunksize=100000,
+    outputs=None,
+    keep_columns=None,
+    **kwargs
+):
+    """
+    Populates a feature table chunk by chunk and writes the results to
+    destination (.csv or .parquet) as they are computed, so memory use is
+    bounded by chunksize rather than by the size of the table.
+
+    Args:
+        source: Path to a .csv/.parquet feature file or an iterable of
+            dataframes.
+        destination (str): Output .csv or .parquet path.
+        chunksize (int): Rows per chunk when reading from a path.
+        outputs (list): Derived properties to compute (all by default).
+        keep_columns (list): Input columns to write next to the derived ones
+            (all by default).
+        kwargs: Passed to RhinoPhysics.
+
+    Returns:
+        int: Number of rows written.
+    """
+    if isinstance(source, str):
+        source = read_chunks(source, chunksize)
+
+    writer = _ChunkWriter(destination)
+    rows = 0
+    try:
+        for chunk in populate_chunks(source, outputs, keep_columns, **kwargs):
+            writer.write(chunk)
+            rows += len(chunk)
+            logger.debug("Wrote {} rows to {}.".format(rows, destination))
+    finally:
+        writer.close()
+    return rows
+
+
+def _shared_array(shape, dtype=np.float64):
+    dtype = np.dtype(dtype)
+    block = shared_memory.SharedMemory(
+        create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1)
+    )
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _populate_task(task):
+    """
+    Worker side of populate_parallel: computes the outputs of the selected
+    rows (a slice or row numbers) of the shared input block into the same
+    rows of the shared output block.
+    """
+    inputs_name, columns, outputs_name, outputs, dtype, rows, selection, kwargs = task
+    inputs_block = shared_memory.SharedMemory(name=inputs_name)
+    outputs_block = shared_memory.SharedMemory(name=outputs_name)
+    try:
+        inputs = np.ndarray((len(columns), rows), dtype=np.float64, buffer=inputs_block.buf)
+        results = np.ndarray((len(outputs), rows), dtype=dtype, buffer=outputs_block.buf)
+        chunk = {col: inputs[i, selection] for i, col in enumerate(columns)}
+        kwargs = dict(kwargs, backend="numpy")
+        derived = RhinoPhysics(chunk, **kwargs).compute(outputs)
+        for i, name in enumerate(outputs):
+            results[i, selection] = derived.get(name, np.nan)
+        computed = list(derived)
+        # Views on the blocks have to go before they can be closed.
+        del inputs, results, chunk, derived
+        return computed
+    finally:
+        inputs_block.close()
+        outputs_block.close()
+
+
+def _partition(dataframe, by, tasks):
+    """
+    Rows of about len/tasks rows per task, never splitting a group of the
+    `by` column (row ranges when None). Tasks are slices when the groups are
+    contiguous, sorted row numbers otherwise.
+    """
+    rows = len(dataframe)
+    order = None
+    if by is None:
+        boundaries = np.arange(rows + 1)
+    else:
+        codes = pd.factorize(dataframe[by])[0]
+        if rows and (codes[1:] < codes[:-1]).any():
+            # Rows without a hole (code -1) sort first and form their own group.
+            order = np.argsort(codes, kind="stable")
+            codes = codes[order]
+        boundaries = np.concatenate(
+            [[0], np.flatnonzero(codes[1:] != codes[:-1]) + 1, [rows]]
+        )
+
+    targets = np.linspace(0, rows, tasks + 1)[1:-1]
+    cuts = boundaries[np.searchsorted(boundaries, targets)]
+    edges = np.unique(np.concatenate([[0], cuts, [rows]]))
+    if order is None:
+        return [slice(start, stop) for start, stop in zip(edges[:-1], edges[1:])]
+    return [np.sort(order[start:stop]) for start, stop in zip(edges[:-1], edges[1:])]
+
+
+def populate_parallel(
+    dataframe, by="hole_id", processes=None, outputs=None, tasks_per_process=4, **kwargs
+):
+    """
+    Computes the RhinoPhysics derived properties of dataframe in a process
+    pool and returns dataframe with the derived columns appended.
+
+    Rows are grouped by hole (the `by` column; row ranges when it is None or
+    missing) into about processes * tasks_per_process tasks. The feature
+    columns the outputs need are copied once into a shared memory block and
+    the workers write their results into a second one, in the original row
+    order, so no rows are pickled between processes and the parent does not
+    reorder anything; the workers read the shared block through the numpy
+    backend of RhinoPhysics.
+
+    Args:
+        dataframe (pd.DataFrame): Rhino features.
+        by (str): Column identifying the holes.
+        processes (int): Pool size (os.cpu_count() by default).
+        outputs (list): Derived properties to compute (all by default).
+        tasks_per_process (int): Tasks queued per process, for load balance.
+        kwargs: Passed to RhinoPhysics.
+
+    Returns:
+        pd.DataFrame
+    """
+    processes = processes or os.cpu_count() or 1
+    physics = RhinoPhysics(dataframe, **kwargs)
+    if outputs is None:
+        outputs = physics._default_outputs()
+    physics.evaluation_order(outputs)
+    outputs = [name for name in outputs if name in physics.supported]
+    columns = physics.required_columns(outputs)
+    rows = len(dataframe)
+
+    if by is not None and by not in dataframe.columns:
+        by = None
+    selections = _partition(dataframe, by, processes * tasks_per_process)
+
+    inputs_block, inputs = _shared_array((len(columns), rows))
+    outputs_block, results = _shared_array((len(outputs), rows), physics._float)
+    try:
+        for i, col in enumerate(columns):
+            inputs[i] = dataframe[col].to_numpy(dtype=np.float64, copy=False)
+        tasks = [
+            (
+                inputs_block.name,
+                columns,
+                outputs_block.name,
+                outputs,
+                results.dtype.str,
+                rows,
+                selection,
+                kwargs,
+            )
+            for selection in selections
+        ]
+        if processes == 1:
+            computed = [_populate_task(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                computed = list(pool.map(_populate_task, tasks))
+
+        computed = set().union(*computed)
+        names = [name for name in outputs if name in computed]
+        derived = results[[outputs.index(name) for name in names]]
+        del inputs, results
+    finally:
+        inputs_block.close()
+        inputs_block.unlink()
+        outputs_block.close()
+        outputs_block.unlink()
+
+    if physics._nullable:
+        derived = pd.DataFrame(
+            {name: physics._output_column(derived[i]) for i, name in enumerate(names)},
+            index=dataframe.index,
+        )
+    else:
+        derived = pd.DataFrame(derived.T, columns=names, index=dataframe.index, copy=False)
+    return pd.concat([dataframe, derived], axis=1, copy=False)
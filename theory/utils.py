@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class GetterClass(object):
     def __init__(self, *args):
         if args:
@@ -10,3 +13,19 @@ class GetterClass(object):
 
     def __repr__(self):
         return "< " + self._repr + " >"
+
+
+def freeze(value):
+    """
+    Hashable snapshot of a parameter (numbers, strings, arrays, lists and
+    dicts), used to build cache keys.
+    """
+    if isinstance(value, np.ndarray):
+        return (value.shape, value.dtype.str, value.tobytes())
+    if isinstance(value, dict):
+        return tuple((key, freeze(value[key])) for key in sorted(value))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value